@@ -1,48 +1,173 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, session, Response, stream_with_context, url_for
 from flask_login import login_required, current_user
 from app.models import Server, ServerLog
 from app.security import require_api_key, admin_required
 from app.monitoring import monitoring_service
+from app.ssh.pool import SSHConnectionPool, PoolExhausted
+from app.ssh.sessions import CancelFlag, registry_from_env
+from app.ssh.commands import iter_fanout, iter_command_output
+from app.ssh.transfer import stream_to_sftp
 from datetime import datetime
 import docker
-from paramiko import SSHClient, AutoAddPolicy
+import json
 from ftplib import FTP
 import os
+import time
+import uuid
 
 api = Blueprint('api', __name__)
 
 class ServerManager:
-    def __init__(self):
-        self.ssh_client = SSHClient()
-        self.ssh_client.set_missing_host_key_policy(AutoAddPolicy())
-        
-    def connect_ssh(self, host, username, password=None, key_filename=None):
+    """SSH/SFTP operations over a shared pool keyed by host, user and auth.
+
+    ``connect_ssh`` registers a target and hands back a session id; later
+    calls lease a pooled client for that target, so concurrent users no
+    longer replace each other's connection. Sessions, running streams and
+    uploads live in a registry shared by all workers (Redis when
+    REDIS_HOST is set), so any worker can serve a session's requests;
+    each worker keeps its own pool of clients.
+    """
+
+    def __init__(self, pool=None, session_ttl=None, registry=None):
+        self.pool = pool or SSHConnectionPool(
+            max_per_key=int(os.environ.get('SSH_POOL_MAX_PER_HOST', '4')),
+            idle_timeout=float(os.environ.get('SSH_POOL_IDLE_TIMEOUT', '300')),
+            keepalive=int(os.environ.get('SSH_KEEPALIVE', '30')),
+            connect_timeout=float(os.environ.get('SSH_CONNECT_TIMEOUT', '10'))
+        )
+        self.session_ttl = session_ttl or float(os.environ.get('SSH_SESSION_TTL', '28800'))
+        self.pool_wait = float(os.environ.get('SSH_POOL_WAIT', '30'))
+        self.fanout_concurrency = int(os.environ.get('SSH_FANOUT_CONCURRENCY', '20'))
+        self.fanout_max_timeout = float(os.environ.get('SSH_FANOUT_MAX_TIMEOUT', '300'))
+        self.stream_max_bytes = int(os.environ.get('SSH_STREAM_MAX_BYTES', str(16 * 1024 * 1024)))
+        self.form_upload_max = int(os.environ.get('SSH_FORM_UPLOAD_MAX_BYTES', str(16 * 1024 * 1024)))
+        self.registry = registry or registry_from_env(self.session_ttl)
+
+    def connect_ssh(self, host, username, password=None, key_filename=None, port=22):
+        """Validate credentials and return ``(session_id, None)`` or ``(None, error)``."""
+        target = {
+            'host': host,
+            'username': username,
+            'password': password,
+            'key_filename': key_filename,
+            'port': int(port or 22)
+        }
         try:
-            self.ssh_client.connect(
-                host,
-                username=username,
-                password=password,
-                key_filename=key_filename
-            )
+            with self.pool.connection(wait=self.pool_wait, **target):
+                pass
+        except Exception as e:
+            return None, str(e)
+
+        return self.registry.create_session(target), None
+
+    def disconnect(self, session_id):
+        return self.registry.drop_session(session_id)
+
+    def _target(self, session_id):
+        return self.registry.session(session_id) if session_id else None
+
+    def execute_command(self, command, session_id):
+        target = self._target(session_id)
+        if target is None:
+            return {'error': 'Not connected'}
+
+        try:
+            with self.pool.connection(wait=self.pool_wait, **target) as client:
+                stdin, stdout, stderr = client.exec_command(command)
+                return {
+                    'output': stdout.read().decode(),
+                    'error': stderr.read().decode()
+                }
+        except PoolExhausted as e:
+            return {'error': str(e)}
+
+    def stream_command(self, command, session_id, max_bytes=None):
+        """Start a streaming command; returns ``(stream_id, chunks)`` or ``(None, error)``.
+
+        A pooled client is leased once the chunk iterator starts and is
+        released when it finishes or is closed.
+        """
+        target = self._target(session_id)
+        if target is None:
+            return None, 'Not connected'
+        max_bytes = min(int(max_bytes or self.stream_max_bytes), self.stream_max_bytes)
+
+        stream_id = uuid.uuid4().hex
+        cancel = CancelFlag(self.registry, stream_id)
+
+        def chunks():
+            try:
+                conn = self.pool.acquire(wait=self.pool_wait, **target)
+            except Exception as e:
+                yield {'error': str(e)}
+                return
+
+            self.registry.add_stream(stream_id, session_id)
+            failed = False
+            try:
+                yield from iter_command_output(conn.client, command, max_bytes, cancel)
+            except Exception as e:
+                failed = True
+                yield {'error': str(e)}
+            finally:
+                self.registry.drop_stream(stream_id)
+                self.pool.release(conn, discard=failed)
+
+        return stream_id, chunks()
+
+    def cancel_stream(self, stream_id, session_id):
+        return bool(session_id) and self.registry.cancel_stream(stream_id, session_id)
+
+    def upload_stream(self, source, remote_path, session_id, total=None, upload_id=None):
+        """Pipe a readable stream straight into a remote file over SFTP."""
+        target = self._target(session_id)
+        if target is None:
+            return 'Not connected'
+
+        upload_id = upload_id or uuid.uuid4().hex
+        self.registry.start_upload(upload_id, session_id, total)
+
+        def progress(written, expected):
+            self.registry.update_upload(upload_id, written)
+
+        try:
+            with self.pool.connection(wait=self.pool_wait, **target) as client:
+                stream_to_sftp(client, source, remote_path, total=total, progress=progress)
             return True
         except Exception as e:
             return str(e)
-            
-    def execute_command(self, command):
-        if not self.ssh_client.get_transport().is_active():
-            return {'error': 'Not connected'}
-            
-        stdin, stdout, stderr = self.ssh_client.exec_command(command)
+        finally:
+            self.registry.drop_upload(upload_id)
+
+    def upload_progress(self, upload_id, session_id):
+        state = self.registry.upload(upload_id, session_id) if session_id else None
+        if state is None:
+            return None
+        elapsed = time.time() - state['started']
         return {
-            'output': stdout.read().decode(),
-            'error': stderr.read().decode()
+            'bytes': state['bytes'],
+            'total': state['total'],
+            'rate': round(state['bytes'] / elapsed) if elapsed > 0 else 0
         }
-        
-    def transfer_file(self, local_path, remote_path):
+
+    def fanout(self, targets, command, concurrency=None, timeout=30.0):
+        """Run one command across many targets; see ``iter_fanout``."""
+        concurrency = min(int(concurrency or self.fanout_concurrency), self.fanout_concurrency)
+        timeout = min(max(float(timeout), 0.1), self.fanout_max_timeout)
+        return iter_fanout(self.pool, targets, command, concurrency, timeout)
+
+    def transfer_file(self, local_path, remote_path, session_id):
+        target = self._target(session_id)
+        if target is None:
+            return 'Not connected'
+
         try:
-            sftp = self.ssh_client.open_sftp()
-            sftp.put(local_path, remote_path)
-            sftp.close()
+            with self.pool.connection(wait=self.pool_wait, **target) as client:
+                sftp = client.open_sftp()
+                try:
+                    sftp.put(local_path, remote_path)
+                finally:
+                    sftp.close()
             return True
         except Exception as e:
             return str(e)
@@ -233,36 +358,180 @@ def restore_server(server_id, backup_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _ssh_session_header():
+    """Session id from the X-SSH-Session header or the cookie session.
+
+    Never from the query string, which ends up in proxy access logs.
+    """
+    return request.headers.get('X-SSH-Session') or session.get('ssh_session_id')
+
+def _ssh_session_id(data=None):
+    """Session id from the request body/form, falling back to ``_ssh_session_header``."""
+    if data and data.get('session_id'):
+        return data['session_id']
+    return request.form.get('session_id') or _ssh_session_header()
+
 @api.route('/server/connect', methods=['POST'])
 def connect_server():
     data = request.json
-    result = server_manager.connect_ssh(
+    session_id, error = server_manager.connect_ssh(
         data['host'],
         data['username'],
         data.get('password'),
-        data.get('key_filename')
+        data.get('key_filename'),
+        data.get('port', 22)
     )
-    return jsonify({'success': result is True, 'error': result if isinstance(result, str) else None})
+    if session_id:
+        session['ssh_session_id'] = session_id
+    return jsonify({'success': session_id is not None, 'session_id': session_id, 'error': error})
+
+@api.route('/server/disconnect', methods=['POST'])
+def disconnect_server():
+    session_id = _ssh_session_id(request.get_json(silent=True))
+    if session_id == session.get('ssh_session_id'):
+        session.pop('ssh_session_id', None)
+    return jsonify({'success': server_manager.disconnect(session_id)})
 
 @api.route('/server/execute', methods=['POST'])
 def execute_command():
     data = request.json
-    result = server_manager.execute_command(data['command'])
+    result = server_manager.execute_command(data['command'], _ssh_session_id(data))
     return jsonify(result)
 
+@api.route('/server/execute/stream', methods=['POST'])
+def stream_command():
+    """Run a command and stream its output as NDJSON chunks."""
+    data = request.json
+    try:
+        stream_id, chunks = server_manager.stream_command(
+            data['command'],
+            _ssh_session_id(data),
+            data.get('max_bytes')
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if stream_id is None:
+        return jsonify({'error': chunks}), 400
+
+    def generate():
+        try:
+            yield json.dumps({'stream_id': stream_id}) + '\n'
+            for chunk in chunks:
+                yield json.dumps(chunk) + '\n'
+        finally:
+            # Client went away: closing the chunks kills the remote command.
+            chunks.close()
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['X-Stream-Id'] = stream_id
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api.route('/server/execute/<stream_id>/cancel', methods=['POST'])
+def cancel_stream(stream_id):
+    cancelled = server_manager.cancel_stream(stream_id, _ssh_session_id(request.get_json(silent=True)))
+    if not cancelled:
+        return jsonify({'error': 'Stream not found'}), 404
+    return jsonify({'success': True})
+
+@api.route('/server/fanout', methods=['POST'])
+@login_required
+def fanout_command():
+    """Run a command on many servers, streaming NDJSON results per host."""
+    data = request.get_json() or {}
+    command = data.get('command')
+    if not command or not data.get('username'):
+        return jsonify({'error': 'command and username are required'}), 400
+
+    query = Server.query
+    if not current_user.is_admin:
+        query = query.filter_by(owner_id=current_user.id)
+    if data.get('server_ids'):
+        query = query.filter(Server.id.in_(data['server_ids']))
+    elif not data.get('all'):
+        return jsonify({'error': 'Provide server_ids or all=true'}), 400
+    servers = query.all()
+
+    targets = [{
+        'server_id': server.id,
+        'host': server.host,
+        'port': data.get('ssh_port', 22),
+        'username': data['username'],
+        'password': data.get('password'),
+        'key_filename': data.get('key_filename')
+    } for server in servers]
+
+    try:
+        results = server_manager.fanout(
+            targets,
+            command,
+            concurrency=data.get('concurrency'),
+            timeout=data.get('timeout', 30)
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        for result in results:
+            yield json.dumps(result) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @api.route('/server/upload', methods=['POST'])
 def upload_file():
+    """Upload a small file sent as the ``file`` field of a multipart form.
+
+    Werkzeug parses the whole form, spooling large parts to a temporary
+    file, before any of it reaches SFTP. Bodies over ``form_upload_max``
+    are refused up front; send those as the raw body of /server/upload/stream.
+    """
+    if request.content_length is None or request.content_length > server_manager.form_upload_max:
+        return jsonify({
+            'error': 'File too large for a form upload; PUT the raw file to the stream URL instead',
+            'stream_url': url_for('.upload_stream')
+        }), 413
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
         
     file = request.files['file']
     remote_path = request.form.get('remote_path', '')
     
-    # Save file temporarily
-    temp_path = os.path.join('/tmp', file.filename)
-    file.save(temp_path)
+    result = server_manager.upload_stream(
+        file.stream,
+        remote_path,
+        _ssh_session_id(),
+        upload_id=request.form.get('upload_id')
+    )
     
-    result = server_manager.transfer_file(temp_path, remote_path)
-    os.remove(temp_path)
+    return jsonify({'success': result is True, 'error': result if isinstance(result, str) else None})
+
+@api.route('/server/upload/stream', methods=['PUT', 'POST'])
+def upload_stream():
+    """Upload the raw request body to ``remote_path`` without buffering it locally.
+
+    The SSH session comes from the X-SSH-Session header or the cookie.
+    """
+    remote_path = request.args.get('remote_path')
+    if not remote_path:
+        return jsonify({'error': 'remote_path is required'}), 400
+    if 'session_id' in request.args:
+        return jsonify({'error': 'Send session_id in the X-SSH-Session header, not the URL'}), 400
+
+    result = server_manager.upload_stream(
+        request.stream,
+        remote_path,
+        _ssh_session_header(),
+        total=request.content_length,
+        upload_id=request.args.get('upload_id')
+    )
     
-    return jsonify({'success': result is True, 'error': result if isinstance(result, str) else None}) 
\ No newline at end of file
+    return jsonify({'success': result is True, 'error': result if isinstance(result, str) else None})
+
+@api.route('/server/upload/<upload_id>/progress', methods=['GET'])
+def upload_progress(upload_id):
+    progress = server_manager.upload_progress(upload_id, _ssh_session_header())
+    if progress is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(progress) 
\ No newline at end of file
@@ -0,0 +1,186 @@
+import codecs
+import select
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional
+
+from app.ssh.pool import PoolExhausted, SSHConnectionPool
+
+READ_CHUNK = 32768
+
+
+def run_command(client, command: str, timeout: float,
+                max_output: int = 65536) -> Dict:
+    """Run ``command`` on a connected client and wait at most ``timeout`` seconds.
+
+    stdout/stderr are each kept up to ``max_output`` bytes; anything past
+    that is drained and dropped so the remote side never blocks on us.
+    Reading goes on until the channel's EOF, since output can still be in
+    flight when the exit status arrives.
+    """
+    deadline = time.monotonic() + timeout
+    chan = client.get_transport().open_session(timeout=timeout)
+    try:
+        chan.exec_command(command)
+        out, err = bytearray(), bytearray()
+        truncated = False
+        while True:
+            while chan.recv_ready():
+                data = chan.recv(READ_CHUNK)
+                keep = max(0, max_output - len(out))
+                out += data[:keep]
+                truncated = truncated or len(data) > keep
+            while chan.recv_stderr_ready():
+                data = chan.recv_stderr(READ_CHUNK)
+                keep = max(0, max_output - len(err))
+                err += data[:keep]
+                truncated = truncated or len(data) > keep
+            if (chan.eof_received or chan.closed) and not chan.recv_ready() and not chan.recv_stderr_ready():
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Command timed out after {timeout:g}s")
+            select.select([chan], [], [], min(remaining, 1.0))
+        if not chan.exit_status_ready():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not chan.status_event.wait(remaining):
+                raise TimeoutError(f"Command timed out after {timeout:g}s")
+        return {
+            'exit_code': chan.recv_exit_status(),
+            'output': out.decode(errors='replace'),
+            'error': err.decode(errors='replace'),
+            'truncated': truncated
+        }
+    finally:
+        chan.close()
+
+
+def iter_command_output(client, command: str, max_bytes: int,
+                        cancel: Optional[threading.Event] = None,
+                        poll_interval: float = 1.0) -> Iterator[Dict]:
+    """Run ``command`` and yield its output chunk by chunk.
+
+    Data is only pulled off the channel when the consumer asks for the next
+    chunk, so a slow reader lets the SSH window fill and stalls the remote
+    writer instead of buffering here. Output stops after ``max_bytes``
+    (stdout and stderr combined). Output is read up to the channel's EOF,
+    not just until the exit status.
+
+    The command runs on a pty so that closing the channel - on ``cancel``,
+    the byte cap or the generator being closed - hangs up the remote
+    process instead of leaving it running detached. The catch is that the
+    pty merges stderr into stdout, so streamed output arrives as 'stdout'.
+    """
+    chan = client.get_transport().open_session()
+    chan.get_pty()
+    decoders = {
+        'stdout': codecs.getincrementaldecoder('utf-8')(errors='replace'),
+        'stderr': codecs.getincrementaldecoder('utf-8')(errors='replace')
+    }
+    sent = 0
+    reason = None
+    try:
+        chan.exec_command(command)
+        while reason is None:
+            if cancel is not None and cancel.is_set():
+                reason = 'cancelled'
+                break
+            if chan.recv_ready():
+                stream, data = 'stdout', chan.recv(READ_CHUNK)
+            elif chan.recv_stderr_ready():
+                stream, data = 'stderr', chan.recv_stderr(READ_CHUNK)
+            elif chan.eof_received or chan.closed:
+                break
+            else:
+                select.select([chan], [], [], poll_interval)
+                continue
+            if not data:
+                continue
+            if sent + len(data) > max_bytes:
+                data = data[:max_bytes - sent]
+                reason = 'truncated'
+            sent += len(data)
+            text = decoders[stream].decode(data)
+            if text:
+                yield {'stream': stream, 'data': text}
+        if reason != 'cancelled':
+            # A trailing partial UTF-8 sequence comes out as U+FFFD rather than vanishing
+            for stream, decoder in decoders.items():
+                text = decoder.decode(b'', final=True)
+                if text:
+                    yield {'stream': stream, 'data': text}
+        yield {
+            'exit_code': chan.recv_exit_status() if reason is None else None,
+            'bytes': sent,
+            'truncated': reason == 'truncated',
+            'cancelled': reason == 'cancelled'
+        }
+    finally:
+        chan.close()
+
+
+def _run_on_target(pool: SSHConnectionPool, target: Dict, command: str,
+                   timeout: float, max_output: int) -> Dict:
+    """Run ``command`` on one target; ``timeout`` bounds the whole attempt.
+
+    Waiting for a pool slot, connecting and running the command all share
+    one deadline, each step getting whatever time the previous ones left.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    result = {'host': target['host'], 'server_id': target.get('server_id')}
+    conn_args = {k: target.get(k) for k in ('host', 'username', 'password', 'key_filename')}
+    conn_args['port'] = target.get('port') or 22
+
+    def remaining() -> float:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise TimeoutError(f"Timed out after {timeout:g}s")
+        return left
+
+    try:
+        with pool.connection(wait=remaining(), connect_timeout=remaining(), **conn_args) as client:
+            result.update(run_command(client, command, remaining(), max_output))
+        result['status'] = 'ok' if result['exit_code'] == 0 else 'failed'
+    except (TimeoutError, socket.timeout, PoolExhausted) as e:
+        result.update(status='timeout', exit_code=None, error=str(e))
+    except Exception as e:
+        result.update(status='error', exit_code=None, error=str(e))
+    result['elapsed'] = round(time.monotonic() - start, 3)
+    return result
+
+
+def iter_fanout(pool: SSHConnectionPool, targets: List[Dict], command: str,
+                concurrency: int = 20, timeout: float = 30.0,
+                max_output: int = 65536) -> Iterator[Dict]:
+    """Run ``command`` on every target, yielding each host's result as it finishes.
+
+    At most ``concurrency`` hosts run at once. The last item yielded is a
+    ``summary`` record aggregating statuses and exit codes.
+    """
+    summary = {'type': 'summary', 'hosts': len(targets), 'ok': 0, 'failed': 0,
+               'timeout': 0, 'error': 0, 'exit_codes': {}}
+    if not targets:
+        yield summary
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(targets))))
+    try:
+        futures = [
+            executor.submit(_run_on_target, pool, target, command, timeout, max_output)
+            for target in targets
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            summary[result['status']] += 1
+            code = 'none' if result['exit_code'] is None else str(result['exit_code'])
+            summary['exit_codes'][code] = summary['exit_codes'].get(code, 0) + 1
+            result['type'] = 'host'
+            yield result
+    finally:
+        # A closed stream (client went away) drops hosts that never started.
+        executor.shutdown(wait=False, cancel_futures=True)
+    yield summary
+
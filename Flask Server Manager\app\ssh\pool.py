@@ -0,0 +1,228 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from paramiko import AutoAddPolicy, SSHClient
+
+# (host, port, username, auth fingerprint)
+PoolKey = Tuple[str, int, str, str]
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection for a key frees up before the wait timeout."""
+
+
+def pool_key(host: str, username: str, password: Optional[str] = None,
+             key_filename: Optional[str] = None, port: int = 22) -> PoolKey:
+    """Build a pool key without keeping the secret itself in the key."""
+    auth = hashlib.sha256(
+        f"{password or ''}\0{key_filename or ''}".encode()
+    ).hexdigest()[:16]
+    return (host, int(port), username, auth)
+
+
+@dataclass
+class PooledConnection:
+    key: PoolKey
+    client: SSHClient
+    created: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SSHConnectionPool:
+    """Keyed pool of authenticated SSH clients.
+
+    Idle clients are parked per key and handed back out after a health
+    check, so repeat commands to a host skip the handshake. Each key is
+    capped at ``max_per_key`` live clients; idle ones are closed by a
+    reaper thread after ``idle_timeout`` seconds.
+    """
+
+    def __init__(self, max_per_key: int = 4, idle_timeout: float = 300.0,
+                 keepalive: int = 30, connect_timeout: float = 10.0,
+                 client_factory: Callable[[], SSHClient] = SSHClient):
+        self.max_per_key = max(1, max_per_key)
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self.client_factory = client_factory
+        self._idle: Dict[PoolKey, List[PooledConnection]] = {}
+        self._open: Dict[PoolKey, int] = {}
+        self._cond = threading.Condition()
+        self._reaper: Optional[threading.Thread] = None
+        self._closed = False
+
+    def acquire(self, host: str, username: str, password: Optional[str] = None,
+                key_filename: Optional[str] = None, port: int = 22,
+                wait: Optional[float] = None,
+                connect_timeout: Optional[float] = None) -> PooledConnection:
+        """Lease a healthy client for the target, connecting if needed.
+
+        ``connect_timeout`` tightens the pool's own connect/banner/auth
+        timeout for this call only.
+        """
+        key = pool_key(host, username, password, key_filename, port)
+        deadline = None if wait is None else time.monotonic() + wait
+        self._start_reaper()
+        while True:
+            with self._cond:
+                while True:
+                    idle = self._idle.get(key)
+                    if idle:
+                        conn = idle.pop()
+                        break
+                    if self._open.get(key, 0) < self.max_per_key:
+                        self._open[key] = self._open.get(key, 0) + 1
+                        conn = None
+                        break
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise PoolExhausted(f"No free SSH connection to {host} for {username}")
+                    self._cond.wait(remaining)
+            # BaseException too: gevent.Timeout or a closed generator must not leak the slot
+            if conn is None:
+                try:
+                    return self._connect(key, host, username, password, key_filename, port,
+                                         connect_timeout)
+                except BaseException:
+                    self._forget(key)
+                    raise
+            try:
+                healthy = self._healthy(conn)
+            except BaseException:
+                self._discard(conn)
+                raise
+            if healthy:
+                conn.last_used = time.monotonic()
+                return conn
+            self._discard(conn)
+
+    def release(self, conn: PooledConnection, discard: bool = False):
+        """Return a leased client; broken ones are closed instead of parked."""
+        if discard or self._closed or not self._healthy(conn, probe=False):
+            self._discard(conn)
+            return
+        conn.last_used = time.monotonic()
+        with self._cond:
+            self._idle.setdefault(conn.key, []).append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, host: str, username: str, password: Optional[str] = None,
+                   key_filename: Optional[str] = None, port: int = 22,
+                   wait: Optional[float] = None, connect_timeout: Optional[float] = None):
+        """Context manager around acquire/release; any exit by exception discards the client."""
+        conn = self.acquire(host, username, password, key_filename, port, wait, connect_timeout)
+        discard = True
+        try:
+            yield conn.client
+            discard = False
+        finally:
+            self.release(conn, discard=discard)
+
+    def evict_idle(self) -> int:
+        """Close clients idle for longer than ``idle_timeout``."""
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._cond:
+            for key, idle in list(self._idle.items()):
+                keep = [c for c in idle if c.last_used >= cutoff]
+                expired.extend(c for c in idle if c.last_used < cutoff)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+        for conn in expired:
+            self._discard(conn)
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                'keys': len(self._open),
+                'open': sum(self._open.values()),
+                'idle': sum(len(v) for v in self._idle.values()),
+            }
+
+    def close(self):
+        """Close every idle client; leased ones are closed on release."""
+        with self._cond:
+            self._closed = True
+            idle = [c for conns in self._idle.values() for c in conns]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+    def _connect(self, key: PoolKey, host, username, password, key_filename, port,
+                 connect_timeout: Optional[float] = None) -> PooledConnection:
+        timeout = self.connect_timeout
+        if connect_timeout is not None:
+            timeout = min(timeout, connect_timeout)
+        client = self.client_factory()
+        client.set_missing_host_key_policy(AutoAddPolicy())
+        try:
+            client.connect(
+                host,
+                port=port,
+                username=username,
+                password=password,
+                key_filename=key_filename,
+                timeout=timeout,
+                banner_timeout=timeout,
+                auth_timeout=timeout,
+            )
+        except BaseException:
+            client.close()
+            raise
+        transport = client.get_transport()
+        if transport is not None and self.keepalive:
+            transport.set_keepalive(self.keepalive)
+        return PooledConnection(key=key, client=client)
+
+    @staticmethod
+    def _healthy(conn: PooledConnection, probe: bool = True) -> bool:
+        transport = conn.client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if probe:
+            # An SSH_MSG_IGNORE write fails fast on a half-dead socket.
+            try:
+                transport.send_ignore()
+            except Exception:
+                return False
+        return True
+
+    def _discard(self, conn: PooledConnection):
+        try:
+            conn.client.close()
+        except Exception:
+            pass
+        self._forget(conn.key)
+
+    def _forget(self, key: PoolKey):
+        with self._cond:
+            count = self._open.get(key, 0) - 1
+            if count > 0:
+                self._open[key] = count
+            else:
+                self._open.pop(key, None)
+            self._cond.notify()
+
+    def _start_reaper(self):
+        if self._reaper is not None or not self.idle_timeout:
+            return
+        with self._cond:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap, daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        interval = max(1.0, min(self.idle_timeout / 2, 30.0))
+        while not self._closed:
+            time.sleep(interval)
+            self.evict_idle()
@@ -0,0 +1,223 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from cryptography.fernet import Fernet
+
+# Shared registry across gunicorn workers and replicas; without it the
+# in-process registry only works with a single worker
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class SessionRegistry:
+    """In-process registry of SSH sessions, running streams and uploads.
+
+    A session id maps to its connection target; streams and uploads are
+    tracked so that cancel and progress requests can find them. Only
+    usable when every request for a session reaches this process, i.e.
+    with a single worker; see ``RedisSessionRegistry`` otherwise.
+    """
+
+    def __init__(self, session_ttl: float = 28800.0):
+        self.session_ttl = session_ttl
+        self._sessions: Dict[str, Dict] = {}
+        self._streams: Dict[str, Dict] = {}
+        self._uploads: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def create_session(self, target: Dict) -> str:
+        session_id = uuid.uuid4().hex
+        now = time.monotonic()
+        with self._lock:
+            self._sessions = {
+                sid: entry for sid, entry in self._sessions.items()
+                if now - entry['last_used'] < self.session_ttl
+            }
+            self._sessions[session_id] = {'target': target, 'last_used': now}
+        return session_id
+
+    def session(self, session_id: str) -> Optional[Dict]:
+        """The session's target, refreshing its idle timer, or None."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or time.monotonic() - entry['last_used'] >= self.session_ttl:
+                return None
+            entry['last_used'] = time.monotonic()
+            return entry['target']
+
+    def drop_session(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def add_stream(self, stream_id: str, session_id: str):
+        with self._lock:
+            self._streams[stream_id] = {'session_id': session_id, 'cancelled': False}
+
+    def cancel_stream(self, stream_id: str, session_id: str) -> bool:
+        with self._lock:
+            entry = self._streams.get(stream_id)
+            if entry is None or entry['session_id'] != session_id:
+                return False
+            entry['cancelled'] = True
+            return True
+
+    def stream_cancelled(self, stream_id: str) -> bool:
+        with self._lock:
+            entry = self._streams.get(stream_id)
+            return entry is not None and entry['cancelled']
+
+    def drop_stream(self, stream_id: str):
+        with self._lock:
+            self._streams.pop(stream_id, None)
+
+    def start_upload(self, upload_id: str, session_id: str, total: Optional[int]):
+        with self._lock:
+            self._uploads[upload_id] = {'session_id': session_id, 'bytes': 0,
+                                        'total': total, 'started': time.time()}
+
+    def update_upload(self, upload_id: str, written: int):
+        with self._lock:
+            if upload_id in self._uploads:
+                self._uploads[upload_id]['bytes'] = written
+
+    def upload(self, upload_id: str, session_id: str) -> Optional[Dict]:
+        """``{'bytes', 'total', 'started'}`` for one of the session's uploads, or None."""
+        with self._lock:
+            entry = self._uploads.get(upload_id)
+            if entry is None or entry['session_id'] != session_id:
+                return None
+            return {key: entry[key] for key in ('bytes', 'total', 'started')}
+
+    def drop_upload(self, upload_id: str):
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+
+
+class RedisSessionRegistry:
+    """``SessionRegistry`` kept in Redis, so every worker and replica shares it.
+
+    Targets hold SSH passwords, so they are stored encrypted with a key
+    derived from ``secret``. Sessions expire after ``session_ttl`` seconds
+    without use; stream and upload entries expire after a day in case the
+    worker running them dies before cleaning up.
+    """
+
+    ENTRY_TTL = 86400
+
+    def __init__(self, client, secret: str, session_ttl: float = 28800.0,
+                 prefix: str = 'ssh:'):
+        if not secret:
+            raise ValueError('RedisSessionRegistry needs a secret to encrypt targets')
+        self.client = client
+        self.session_ttl = int(session_ttl)
+        self.prefix = prefix
+        key = hashlib.sha256(f"ssh-sessions\0{secret}".encode()).digest()
+        self._fernet = Fernet(base64.urlsafe_b64encode(key))
+
+    def _key(self, kind: str, item_id: str) -> str:
+        return f"{self.prefix}{kind}:{item_id}"
+
+    def create_session(self, target: Dict) -> str:
+        session_id = uuid.uuid4().hex
+        token = self._fernet.encrypt(json.dumps(target).encode())
+        self.client.set(self._key('session', session_id), token, ex=self.session_ttl)
+        return session_id
+
+    def session(self, session_id: str) -> Optional[Dict]:
+        if not session_id:
+            return None
+        key = self._key('session', session_id)
+        token = self.client.get(key)
+        if token is None:
+            return None
+        self.client.expire(key, self.session_ttl)
+        return json.loads(self._fernet.decrypt(token))
+
+    def drop_session(self, session_id: str) -> bool:
+        return bool(session_id) and self.client.delete(self._key('session', session_id)) > 0
+
+    def add_stream(self, stream_id: str, session_id: str):
+        self.client.set(self._key('stream', stream_id), session_id, ex=self.ENTRY_TTL)
+
+    def cancel_stream(self, stream_id: str, session_id: str) -> bool:
+        owner = self.client.get(self._key('stream', stream_id))
+        if owner is None or owner.decode() != session_id:
+            return False
+        self.client.set(self._key('stream-cancel', stream_id), 1, ex=self.ENTRY_TTL)
+        return True
+
+    def stream_cancelled(self, stream_id: str) -> bool:
+        return bool(self.client.exists(self._key('stream-cancel', stream_id)))
+
+    def drop_stream(self, stream_id: str):
+        self.client.delete(self._key('stream', stream_id), self._key('stream-cancel', stream_id))
+
+    def start_upload(self, upload_id: str, session_id: str, total: Optional[int]):
+        key = self._key('upload', upload_id)
+        self.client.hset(key, mapping={'session_id': session_id, 'bytes': 0,
+                                       'total': -1 if total is None else total,
+                                       'started': time.time()})
+        self.client.expire(key, self.ENTRY_TTL)
+
+    def update_upload(self, upload_id: str, written: int):
+        self.client.hset(self._key('upload', upload_id), 'bytes', written)
+
+    def upload(self, upload_id: str, session_id: str) -> Optional[Dict]:
+        entry = {k.decode(): v.decode()
+                 for k, v in self.client.hgetall(self._key('upload', upload_id)).items()}
+        if entry.get('session_id') != session_id:
+            return None
+        total = int(entry['total'])
+        return {'bytes': int(entry['bytes']), 'total': None if total < 0 else total,
+                'started': float(entry['started'])}
+
+    def drop_upload(self, upload_id: str):
+        self.client.delete(self._key('upload', upload_id))
+
+
+class CancelFlag:
+    """``threading.Event``-like view of a stream's cancel flag in a registry.
+
+    ``is_set()`` is polled on every output chunk, so the registry is only
+    asked again after ``interval`` seconds.
+    """
+
+    def __init__(self, registry, stream_id: str, interval: float = 0.5):
+        self.registry = registry
+        self.stream_id = stream_id
+        self.interval = interval
+        self._checked = 0.0
+        self._set = False
+
+    def is_set(self) -> bool:
+        now = time.monotonic()
+        if not self._set and now - self._checked >= self.interval:
+            self._checked = now
+            self._set = self.registry.stream_cancelled(self.stream_id)
+        return self._set
+
+
+def registry_from_env(session_ttl: float):
+    """Redis-backed registry when REDIS_HOST is set, otherwise in-process."""
+    if not os.environ.get('REDIS_HOST'):
+        return SessionRegistry(session_ttl)
+    secret = os.environ.get('SSH_SESSION_SECRET') or os.environ.get('SECRET_KEY')
+    if not secret:
+        raise RuntimeError('REDIS_HOST is set but neither SSH_SESSION_SECRET nor SECRET_KEY is, '
+                           'so SSH credentials could not be encrypted')
+    if redis is None:
+        raise RuntimeError('REDIS_HOST is set but the redis package is not installed')
+    client = redis.Redis(
+        host=os.environ['REDIS_HOST'],
+        port=int(os.environ.get('REDIS_PORT', '6379')),
+        db=int(os.environ.get('REDIS_SSH_DB', '2'))
+    )
+    return RedisSessionRegistry(client, secret, session_ttl)
@@ -0,0 +1,53 @@
+from typing import BinaryIO, Callable, Optional
+
+from paramiko import SFTPClient
+
+UPLOAD_CHUNK = 1024 * 1024
+SFTP_WINDOW = 64 * 1024 * 1024
+SFTP_MAX_PACKET = 256 * 1024
+
+
+def stream_to_sftp(client, source: BinaryIO, remote_path: str,
+                   total: Optional[int] = None, chunk_size: int = UPLOAD_CHUNK,
+                   window_size: int = SFTP_WINDOW,
+                   progress: Optional[Callable[[int, Optional[int]], None]] = None) -> int:
+    """Copy ``source`` to ``remote_path`` without touching local disk.
+
+    Writes are pipelined (no wait for each SFTP ack) over a channel with a
+    large window, so throughput is bound by the link rather than the round
+    trip. Data goes to ``remote_path + '.part'``, which is renamed over
+    ``remote_path`` only once the upload is complete, so an existing file
+    is never clobbered by a partial one; a failed upload removes only the
+    ``.part`` file. Returns the number of bytes written.
+    """
+    sftp = SFTPClient.from_transport(
+        client.get_transport(),
+        window_size=window_size,
+        max_packet_size=SFTP_MAX_PACKET
+    )
+    partial = remote_path + '.part'
+    written = 0
+    try:
+        try:
+            with sftp.open(partial, 'wb', bufsize=chunk_size) as remote:
+                remote.set_pipelined(True)
+                while True:
+                    data = source.read(chunk_size)
+                    if not data:
+                        break
+                    remote.write(data)
+                    written += len(data)
+                    if progress is not None:
+                        progress(written, total)
+            if total is not None and written != total:
+                raise IOError(f"Upload incomplete: got {written} of {total} bytes")
+            sftp.posix_rename(partial, remote_path)
+        except Exception:
+            try:
+                sftp.remove(partial)
+            except Exception:
+                pass
+            raise
+        return written
+    finally:
+        sftp.close()
@@ -1,7 +1,10 @@
 import multiprocessing
+import os
 
 bind = "0.0.0.0:8000"
-workers = multiprocessing.cpu_count() * 2 + 1
+# SSH sessions, streams and uploads are shared between workers through
+# Redis; without it they live in one process, so run a single worker
+workers = multiprocessing.cpu_count() * 2 + 1 if os.environ.get('REDIS_HOST') else 1
 worker_class = "gevent"
 worker_connections = 1000
 timeout = 30
@@ -0,0 +1,161 @@
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Dict, Iterable, Iterator, List, Optional
+from scan_engine import HostRecord, iter_pipelined
+
+HTTP_PROBE = b'HEAD / HTTP/1.0\r\nUser-Agent: FlaskNetScan\r\n\r\n'
+# Ports where the client must talk first; everything else gets a chance to greet
+HTTP_PORTS = {80, 8000, 8008, 8080, 8081, 8888}
+# TLS handshakes are the TLS stage's job; a plaintext probe just gets garbage
+SKIP_PORTS = {443, 465, 636, 993, 995, 3389, 8443}
+
+# (service, pattern, default product); patterns may capture product and version
+SIGNATURES = [
+    ('ssh', re.compile(rb'^SSH-[\d.]+-(?P<product>[A-Za-z]+)[_-]?(?P<version>[\w.]+)?'), None),
+    ('http', re.compile(rb'^HTTP/[\d.]+ \d{3}.*?\r\nServer: *(?P<product>[^/\r\n ]+)'
+                        rb'(?:/(?P<version>[^\s]+))?', re.DOTALL | re.IGNORECASE), None),
+    ('http', re.compile(rb'^HTTP/[\d.]+ \d{3}'), None),
+    ('mysql', re.compile(rb'^.{4}\x0a(?P<version>\d[^\x00]*)\x00', re.DOTALL), 'MySQL'),
+    ('smtp', re.compile(rb'^220[ -](?:\S+ )?(?P<product>[^\r\n]*E?SMTP[^\r\n]*)'), None),
+    ('ftp', re.compile(rb'^220[ -](?P<product>[^\r\n]*)'), None),
+    ('pop3', re.compile(rb'^\+OK(?P<product>[^\r\n]*)'), None),
+    ('imap', re.compile(rb'^\* OK(?P<product>[^\r\n]*)'), None),
+    ('redis', re.compile(rb'^-(?:ERR|NOAUTH|DENIED)'), 'Redis'),
+]
+
+def fingerprint(port: int, banner: bytes) -> Dict:
+    """Match a banner against the signature table."""
+    info = {
+        'port': port,
+        'service': None,
+        'product': None,
+        'version': None,
+        'banner': banner.split(b'\n', 1)[0].strip().decode('latin-1')[:200]
+    }
+    for service, pattern, product in SIGNATURES:
+        match = pattern.search(banner)
+        if not match:
+            continue
+        groups = match.groupdict()
+        info['service'] = service
+        info['product'] = (groups.get('product') or b'').strip().decode('latin-1') or product
+        info['version'] = (groups.get('version') or b'').decode('latin-1') or None
+        if service == 'mysql' and info['version'] and 'mariadb' in info['version'].lower():
+            info['product'] = 'MariaDB'
+        break
+    return info
+
+class BannerGrabber:
+    """Reads service banners from open ports without holding up the scan.
+
+    Grabs run on a dedicated event loop thread, bounded by `concurrency`,
+    each limited to max_bytes and a per-connection deadline. A host's
+    pipeline deadline starts when its first grab gets a slot, not when it
+    is queued; hosts that still run out of time are marked
+    services_timed_out rather than reported with no services.
+    """
+
+    def __init__(self, concurrency: int = 64, timeout: float = 2.0,
+                 greeting_wait: float = 0.75, max_bytes: int = 1024):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.greeting_wait = greeting_wait
+        self.max_bytes = max_bytes
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='banner-grabber',
+                                 daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    async def _read(self, reader: asyncio.StreamReader, deadline: float,
+                    until: Optional[bytes] = None) -> bytes:
+        data = b''
+        while len(data) < self.max_bytes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(reader.read(self.max_bytes - len(data)), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            data += chunk
+            if until is None or until in data:
+                break
+        return data
+
+    async def grab(self, ip: str, port: int,
+                   started: Optional[List[float]] = None) -> Optional[Dict]:
+        """Fingerprint one open port, or None if it said nothing useful.
+
+        The first grab to get a slot records the time in `started`.
+        """
+        if port in SKIP_PORTS:
+            return None
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            if started is not None and not started:
+                started.append(time.monotonic())
+            deadline = time.monotonic() + self.timeout
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(ip, port), self.timeout
+                )
+            except (OSError, asyncio.TimeoutError):
+                return None
+            try:
+                banner = b''
+                if port not in HTTP_PORTS:
+                    banner = await self._read(
+                        reader, min(deadline, time.monotonic() + self.greeting_wait)
+                    )
+                if not banner:
+                    writer.write(HTTP_PROBE)
+                    await writer.drain()
+                    banner = await self._read(reader, deadline, until=b'\r\n\r\n')
+            except OSError:
+                return None
+            finally:
+                writer.close()
+        return fingerprint(port, banner) if banner else None
+
+    async def grab_host(self, ip: str, ports: List[int],
+                        started: Optional[List[float]] = None) -> List[Dict]:
+        results = await asyncio.gather(*(self.grab(ip, port, started) for port in ports))
+        return [info for info in results if info]
+
+    def submit(self, ip: str, ports: List[int]) -> Future:
+        started: List[float] = []
+        future = asyncio.run_coroutine_threadsafe(self.grab_host(ip, ports, started),
+                                                  self._ensure_loop())
+        future.started = started
+        return future
+
+    @staticmethod
+    def _started(future: Future) -> Optional[float]:
+        started = getattr(future, 'started', None)
+        return started[0] if started else None
+
+    def iter_fingerprinted(self, results: Iterable[HostRecord]) -> Iterator[HostRecord]:
+        """Fill in record['services'] for live hosts as the scan streams by."""
+        return iter_pipelined(results, lambda item: self.submit(item[0], item[1]),
+                              self._apply, self.timeout * 2, started=self._started)
+
+    def _apply(self, record: Dict, future: Future, time_left: float):
+        try:
+            record['services'] = future.result(timeout=time_left)
+        except TimeoutError:
+            future.cancel()
+            record['services_timed_out'] = True
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Scanner throughput benchmark against stand-in listeners on loopback.
+
+Every address in 127.0.0.0/8 routes to the loopback interface, so a fake
+"subnet" can be laid out on e.g. 127.0.1.0/24: some hosts get accepting
+listeners, some get blackholed ports (a listener whose accept queue is
+full, so further SYNs are dropped and connects time out), and the rest
+refuse connections. Each engine scans the same layout and the results are
+written as JSON so runs can be compared over time.
+
+    python scan_bench.py --hosts 254 --live 20 --blackholed 4 --output bench.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import selectors
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List
+
+from scan_engine import AsyncScanEngine
+from scan_targets import TargetSpec
+from start import ServerManager
+
+logger = logging.getLogger(__name__)
+
+BENCH_PORTS = [18080, 18443, 18022, 18021, 13389, 13306]
+
+class StandInNetwork:
+    """Accepting and blackholed listeners bound to loopback aliases."""
+
+    def __init__(self, subnet: str, hosts: int, live: int, blackholed: int, ports: List[int]):
+        self.subnet = subnet
+        self.hosts = hosts
+        self.live = live
+        self.blackholed = blackholed
+        self.ports = ports
+        self._sockets: List[socket.socket] = []
+        self._selector = selectors.DefaultSelector()
+        self._running = False
+
+    @property
+    def targets(self) -> str:
+        return f"{self.subnet}.1-{self.hosts}"
+
+    def start(self):
+        for i in range(1, self.live + 1):
+            for port in self.ports:
+                listener = self._listen(f"{self.subnet}.{i}", port, backlog=128)
+                listener.setblocking(False)
+                self._selector.register(listener, selectors.EVENT_READ)
+        for i in range(self.live + 1, self.live + self.blackholed + 1):
+            for port in self.ports:
+                self._blackhole(f"{self.subnet}.{i}", port)
+        self._running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        for sock in self._sockets:
+            sock.close()
+
+    def _listen(self, ip: str, port: int, backlog: int) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((ip, port))
+        sock.listen(backlog)
+        self._sockets.append(sock)
+        return sock
+
+    def _blackhole(self, ip: str, port: int):
+        """Listen but never accept, and fill the queue so later SYNs are dropped."""
+        self._listen(ip, port, backlog=0)
+        for _ in range(2):
+            filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            filler.setblocking(False)
+            filler.connect_ex((ip, port))
+            self._sockets.append(filler)
+        time.sleep(0.01)
+
+    def _accept_loop(self):
+        while self._running:
+            for key, _ in self._selector.select(timeout=0.1):
+                try:
+                    conn, _ = key.fileobj.accept()
+                    conn.close()
+                except OSError:
+                    pass
+
+class TimedEngine(AsyncScanEngine):
+    """AsyncScanEngine that records how long each probe took, queueing included."""
+
+    latencies: List[float] = []
+
+    async def probe_state(self, ip, port, semaphore):
+        started = time.perf_counter()
+        try:
+            return await super().probe_state(ip, port, semaphore)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+class BenchServerManager(ServerManager):
+    """ServerManager whose sequential and async probes are timed."""
+
+    def __init__(self, latencies: List[float], **kwargs):
+        super().__init__(**kwargs)
+        self.latencies = latencies
+        self.engine_class = type('BoundTimedEngine', (TimedEngine,), {'latencies': latencies})
+
+    def scan_port(self, ip, port):
+        started = time.perf_counter()
+        try:
+            return super().scan_port(ip, port)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+# name -> ServerManager options; add new engines here to have them benchmarked
+ENGINES = {
+    'sequential': {'scan_engine': 'sequential'},
+    'async': {'scan_engine': 'async', 'scan_discovery': False},
+    'async-discovery': {'scan_engine': 'async', 'scan_discovery': True},
+    'sharded': {'scan_engine': 'sharded', 'scan_discovery': False},
+}
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_engine(name: str, options: Dict, network: StandInNetwork, concurrency: int) -> Dict:
+    latencies: List[float] = []
+    manager = BenchServerManager(latencies, scan_concurrency=concurrency, **options)
+    spec = TargetSpec.parse(network.targets)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    hosts = open_hosts = 0
+    for ip, open_ports in manager.iter_scan_hosts(spec, network.ports):
+        hosts += 1
+        open_hosts += bool(open_ports)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        'hosts': hosts,
+        'open_hosts': open_hosts,
+        'probes': len(latencies),
+        'seconds': round(elapsed, 4),
+        'hosts_per_s': round(hosts / elapsed, 2) if elapsed else None,
+        'probes_per_s': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50_probe_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_probe_ms': round(percentile(latencies, 99) * 1000, 3),
+        'peak_memory_kb': round(peak / 1024, 1)
+    }
+    if not latencies:
+        # Probes ran in other processes (sharded); only end-to-end numbers apply
+        for key in ('probes', 'probes_per_s', 'p50_probe_ms', 'p99_probe_ms'):
+            result[key] = None
+    logger.info(f"{name}: {result}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark scan engines on loopback')
+    parser.add_argument('--subnet', default='127.0.1', help='/24 prefix inside 127.0.0.0/8')
+    parser.add_argument('--hosts', type=int, default=254)
+    parser.add_argument('--live', type=int, default=20, help='hosts with accepting listeners')
+    parser.add_argument('--blackholed', type=int, default=4, help='hosts whose ports drop SYNs')
+    parser.add_argument('--concurrency', type=int, default=512)
+    parser.add_argument('--engines', default=','.join(ENGINES))
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    # Keep benchmark runs out of the real scan state database
+    os.environ['SCAN_STATE_DB'] = os.path.join(tempfile.mkdtemp(), 'bench_state.db')
+
+    network = StandInNetwork(args.subnet, args.hosts, args.live, args.blackholed, BENCH_PORTS)
+    network.start()
+    try:
+        results = {
+            name: run_engine(name, ENGINES[name], network, args.concurrency)
+            for name in args.engines.split(',')
+        }
+    finally:
+        network.stop()
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'platform': platform.platform(),
+        'python_version': platform.python_version(),
+        'config': vars(args),
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+import argparse
+import ipaddress
+import itertools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from scan_engine import AsyncScanEngine, COMMON_PORTS, HostResult
+from scan_pacing import PacingPolicy
+from scan_shards import _ordered
+from scan_targets import TargetSpec
+from scan_timing import AdaptiveTimeouts
+
+logger = logging.getLogger(__name__)
+
+def _tokens(intervals) -> List[str]:
+    return [f"{ipaddress.IPv4Address(start)}-{ipaddress.IPv4Address(end)}"
+            for start, end in intervals]
+
+class FileQueue:
+    """Shard queue in a directory shared by the coordinator and workers.
+
+    Claiming is an atomic rename from pending/ to claimed/, tagged with the
+    worker id, so two workers never take the same shard. Workers append
+    results to results/<shard>.<attempt>.jsonl and touch workers/<id> as a
+    heartbeat. Any shared filesystem (NFS, SMB) will do between nodes.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        for name in ('pending', 'claimed', 'results', 'workers', 'cancelled'):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.root, *parts)
+
+    def _write(self, path: str, data: Dict):
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def put(self, shard: Dict):
+        self._write(self.path('pending', f"{shard['id']}.json"), shard)
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """Take the oldest pending shard, or None if there is none."""
+        for name in sorted(os.listdir(self.path('pending'))):
+            if not name.endswith('.json'):
+                continue
+            claimed = self.path('claimed', f"{name[:-5]}.{worker_id}.json")
+            try:
+                os.rename(self.path('pending', name), claimed)
+            except FileNotFoundError:
+                continue  # Another worker got there first
+            os.utime(claimed)
+            with open(claimed) as f:
+                return json.load(f)
+        return None
+
+    def claims(self, job_id: str) -> Dict[str, Tuple[str, float]]:
+        """shard id -> (worker id, claim time) for a job's claimed shards."""
+        claims = {}
+        for name in os.listdir(self.path('claimed')):
+            if name.startswith(job_id) and name.endswith('.json'):
+                shard_id, worker_id = name[:-5].split('.', 1)
+                try:
+                    claims[shard_id] = (worker_id, os.path.getmtime(self.path('claimed', name)))
+                except FileNotFoundError:
+                    pass
+        return claims
+
+    def release(self, shard_id: str, worker_id: str):
+        try:
+            os.remove(self.path('claimed', f"{shard_id}.{worker_id}.json"))
+        except FileNotFoundError:
+            pass
+
+    def heartbeat(self, worker_id: str):
+        path = self.path('workers', worker_id)
+        with open(path, 'a'):
+            os.utime(path)
+
+    def last_heartbeat(self, worker_id: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.path('workers', worker_id))
+        except FileNotFoundError:
+            return None
+
+    def live_workers(self, timeout: float) -> List[str]:
+        now = time.time()
+        return [worker_id for worker_id in os.listdir(self.path('workers'))
+                if now - (self.last_heartbeat(worker_id) or 0) < timeout]
+
+    def cancel(self, job_id: str):
+        open(self.path('cancelled', job_id), 'a').close()
+
+    def is_cancelled(self, job_id: str) -> bool:
+        return os.path.exists(self.path('cancelled', job_id))
+
+    def cleanup(self, job_id: str):
+        for folder in ('pending', 'claimed', 'results', 'cancelled'):
+            for name in os.listdir(self.path(folder)):
+                if name.startswith(job_id):
+                    try:
+                        os.remove(self.path(folder, name))
+                    except FileNotFoundError:
+                        pass
+
+class ScanCoordinator:
+    """Splits a scan into shards for remote ScanWorkers and merges their results.
+
+    Shard i covers every n-th address of the target spec starting at i.
+    Workers report hosts in shard order, so when a worker stops
+    heartbeating its shard is queued again with an offset past the hosts
+    already reported, and the next worker resumes there instead of
+    rescanning. Results stream out as they arrive from all shards.
+
+    Each shard carries its share of the pacing policy and the discovery
+    setting, so workers scan the way the coordinating server is configured.
+    """
+
+    def __init__(self, queue: FileQueue, shards: int = 8, heartbeat_timeout: float = 15.0,
+                 poll_interval: float = 0.1, pacing: Optional[PacingPolicy] = None,
+                 discovery: Optional[bool] = None):
+        self.queue = queue
+        self.shards = shards
+        self.heartbeat_timeout = heartbeat_timeout
+        self.poll_interval = poll_interval
+        self.pacing = pacing
+        self.discovery = discovery
+        self.reassigned = 0
+
+    def iter_scan(self, spec, ports: List[int] = COMMON_PORTS) -> Iterator[HostResult]:
+        """Yield (ip, open_ports) for every host in spec, as workers report them."""
+        job_id = uuid.uuid4().hex[:12]
+        count = max(1, min(self.shards, len(spec)))
+        # Shards run side by side on different workers, like sharded mode's processes
+        pacing = asdict(self.pacing.split(count)) if self.pacing else None
+        shards = {}
+        for index in range(count):
+            shard = {
+                'id': f"{job_id}-{index:04d}",
+                'job': job_id,
+                'include': _tokens(spec.include),
+                'exclude': _tokens(spec.exclude),
+                'index': index,
+                'count': count,
+                'ports': list(ports),
+                'pacing': pacing,
+                'discovery': self.discovery,
+                'offset': 0,
+                'attempt': 0
+            }
+            self.queue.put(shard)
+            # Reader state: current attempt, bytes consumed, hosts received
+            shards[shard['id']] = {'shard': shard, 'position': 0, 'received': 0, 'done': False}
+
+        last_check = last_worker_seen = time.monotonic()
+        try:
+            while not all(state['done'] for state in shards.values()):
+                progressed = False
+                for state in shards.values():
+                    if state['done']:
+                        continue
+                    for line in self._read_new(state):
+                        progressed = True
+                        if 'done' in line:
+                            state['done'] = True
+                            break
+                        state['received'] += 1
+                        yield line['ip'], line['ports']
+                now = time.monotonic()
+                if now - last_check >= min(1.0, self.heartbeat_timeout / 2):
+                    last_check = now
+                    self._reassign_dead(job_id, shards)
+                    if self.queue.live_workers(self.heartbeat_timeout):
+                        last_worker_seen = now
+                    elif now - last_worker_seen > self.heartbeat_timeout:
+                        raise RuntimeError('No scan workers are heartbeating')
+                if not progressed:
+                    time.sleep(self.poll_interval)
+        finally:
+            if not all(state['done'] for state in shards.values()):
+                self.queue.cancel(job_id)
+                # Let workers see the flag before the job's files disappear
+                time.sleep(self.poll_interval)
+            self.queue.cleanup(job_id)
+
+    def _read_new(self, state: Dict) -> Iterator[Dict]:
+        shard = state['shard']
+        path = self.queue.path('results', f"{shard['id']}.{shard['attempt']}.jsonl")
+        try:
+            with open(path, 'rb') as f:
+                f.seek(state['position'])
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # Only whole lines; a partial write is picked up on the next poll
+        end = data.rfind(b'\n') + 1
+        state['position'] += end
+        for raw in data[:end].splitlines():
+            yield json.loads(raw)
+
+    def _reassign_dead(self, job_id: str, shards: Dict):
+        now = time.time()
+        for shard_id, (worker_id, claimed_at) in self.queue.claims(job_id).items():
+            state = shards.get(shard_id)
+            if state is None or state['done']:
+                continue
+            beat = self.queue.last_heartbeat(worker_id) or claimed_at
+            if now - beat < self.heartbeat_timeout:
+                continue
+            logger.warning(f"Worker {worker_id} stopped heartbeating, requeueing {shard_id}")
+            # Hosts it reported but we haven't read yet just get scanned again
+            shard = dict(state['shard'], offset=state['received'],
+                         attempt=state['shard']['attempt'] + 1)
+            self.queue.release(shard_id, worker_id)
+            state.update(shard=shard, position=0)
+            self.queue.put(shard)
+            self.reassigned += 1
+
+    def scan(self, spec, ports: List[int] = COMMON_PORTS) -> Dict[str, List[int]]:
+        """Run a full distributed sweep and collect every host's open ports."""
+        return dict(self.iter_scan(spec, ports))
+
+class ScanWorker:
+    """Claims shards from a FileQueue and scans them with an AsyncScanEngine.
+
+    Pacing and discovery settings carried by a shard take precedence over
+    the worker's own, which only apply to shards that don't set them.
+    """
+
+    def __init__(self, queue: FileQueue, worker_id: Optional[str] = None,
+                 concurrency: int = 512, timeout: float = 0.5, discovery: bool = False,
+                 pacing: Optional[PacingPolicy] = None,
+                 heartbeat_interval: float = 2.0, flush_interval: float = 0.5):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.engine_options = {'concurrency': concurrency, 'timeout': timeout,
+                               'discovery': discovery, 'pacing': pacing}
+        self.heartbeat_interval = heartbeat_interval
+        self.flush_interval = flush_interval
+        self._stop = threading.Event()
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            self.queue.heartbeat(self.worker_id)
+
+    def run(self, idle_exit: Optional[float] = None):
+        """Process shards until stop() is called, or after idle_exit seconds without work."""
+        self.queue.heartbeat(self.worker_id)
+        threading.Thread(target=self._heartbeat, name='scan-worker-heartbeat',
+                         daemon=True).start()
+        idle_since = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                shard = self.queue.claim(self.worker_id)
+                if shard is None:
+                    if idle_exit is not None and time.monotonic() - idle_since >= idle_exit:
+                        break
+                    self._stop.wait(0.2)
+                    continue
+                self.scan_shard(shard)
+                idle_since = time.monotonic()
+        finally:
+            self._stop.set()
+
+    def stop(self):
+        self._stop.set()
+
+    def make_engine(self, shard: Dict) -> AsyncScanEngine:
+        options = dict(self.engine_options)
+        if shard.get('pacing'):
+            options['pacing'] = PacingPolicy(**shard['pacing'])
+        if shard.get('discovery') is not None:
+            options['discovery'] = shard['discovery']
+        return AsyncScanEngine(timeouts=AdaptiveTimeouts(), **options)
+
+    def scan_shard(self, shard: Dict):
+        spec = TargetSpec(shard['include'], shard['exclude'])
+        hosts = itertools.islice(spec.iter_shard(shard['index'], shard['count']),
+                                 shard['offset'], None)
+        engine = self.make_engine(shard)
+        issued = deque()
+
+        def issue():
+            for ip in hosts:
+                issued.append(ip)
+                yield ip
+
+        path = self.queue.path('results', f"{shard['id']}.{shard['attempt']}.jsonl")
+        results = _ordered(engine.iter_scan(issue(), shard['ports']), issued)
+        scanned = 0
+        last_flush = time.monotonic()
+        with open(path, 'a') as out:
+            try:
+                for ip, open_ports in results:
+                    out.write(json.dumps({'ip': ip, 'ports': open_ports}) + '\n')
+                    scanned += 1
+                    if time.monotonic() - last_flush >= self.flush_interval:
+                        out.flush()
+                        last_flush = time.monotonic()
+                        if self.queue.is_cancelled(shard['job']) or self._stop.is_set():
+                            return
+                out.write(json.dumps({'done': scanned}) + '\n')
+            finally:
+                results.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Remote scan worker for a shared shard queue')
+    parser.add_argument('--queue', default=os.environ.get('SCAN_QUEUE_DIR', 'scan_queue'),
+                        help='queue directory shared with the coordinator')
+    parser.add_argument('--concurrency', type=int, default=512)
+    parser.add_argument('--timeout', type=float, default=0.5)
+    parser.add_argument('--discovery', action='store_true')
+    parser.add_argument('--rate', type=float, default=float(os.environ.get('SCAN_RATE', 0)),
+                        help='probes/s for shards that carry no pacing policy (0 = unlimited)')
+    parser.add_argument('--subnet-concurrency', type=int,
+                        default=int(os.environ.get('SCAN_SUBNET_CONCURRENCY', 128)))
+    parser.add_argument('--host-concurrency', type=int,
+                        default=int(os.environ.get('SCAN_HOST_CONCURRENCY', 16)))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pacing = PacingPolicy(rate=args.rate, per_subnet=args.subnet_concurrency,
+                          per_host=args.host_concurrency)
+    worker = ScanWorker(FileQueue(args.queue), concurrency=args.concurrency,
+                        timeout=args.timeout, discovery=args.discovery, pacing=pacing)
+    logger.info(f"Scan worker {worker.worker_id} polling {args.queue}")
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+import asyncio
+import errno
+import itertools
+import socket
+import time
+from collections import deque
+from concurrent.futures import Future, wait
+from typing import (AsyncIterator, Callable, Dict, Iterable, Iterator, List,
+                    Optional, Set, Tuple)
+from scan_timing import AdaptiveTimeouts
+from scan_pacing import PacingPolicy, ProbePacer, REFUSED, UNREACHABLE
+from scan_metrics import METRICS
+
+COMMON_PORTS = [80, 443, 22, 21, 3389, 3306]  # Web, SSH, FTP, RDP, MySQL
+# Liveness checks; a host that drops one of these usually answers another
+DISCOVERY_PORTS = [80, 443, 22, 3389]
+
+# Probe outcomes: 'open' connected, 'closed' refused (host answered with RST),
+# 'filtered' timed out or unreachable, 'error' no socket could be opened
+# locally; 'cancelled' only shows up in metrics, for probes abandoned when a
+# scan stops early
+OPEN, CLOSED, FILTERED = 'open', 'closed', 'filtered'
+ERROR, CANCELLED = 'error', 'cancelled'
+UNREACHABLE_ERRNOS = (errno.EHOSTUNREACH, errno.ENETUNREACH)
+# Out of descriptors/buffers: wait for other probes to close theirs and retry
+RESOURCE_ERRNOS = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM)
+SOCKET_BACKOFF = (0.01, 0.05, 0.25, 1.0)
+
+HostResult = Tuple[str, List[int]]
+# (ip, open_ports, record): record is the host's result dict, None if nothing is open
+HostRecord = Tuple[str, List[int], Optional[Dict]]
+# How often a pipeline stalled on queued (not yet started) work re-checks it
+QUEUE_POLL = 0.05
+
+def read_neighbour_table(path: str = '/proc/net/arp') -> Set[str]:
+    """Addresses with a complete entry in the kernel ARP/neighbour table."""
+    neighbours = set()
+    try:
+        with open(path) as f:
+            next(f, None)  # header
+            for line in f:
+                fields = line.split()
+                # ATF_COM (0x2) marks a resolved entry
+                if len(fields) >= 4 and int(fields[2], 16) & 0x2 \
+                        and fields[3] != '00:00:00:00:00:00':
+                    neighbours.add(fields[0])
+    except (OSError, ValueError):
+        pass
+    return neighbours
+
+def iter_pipelined(results: Iterable[HostRecord],
+                   submit: Callable[[HostRecord], Optional[Future]],
+                   apply: Callable[[Dict, Future, float], None],
+                   timeout: float,
+                   started: Optional[Callable[[Future], Optional[float]]] = None
+                   ) -> Iterator[HostRecord]:
+    """Overlap per-host follow-up work with the stream producing results.
+
+    submit() starts work for a live host and returns its Future (or None to
+    skip it); apply(record, future, time_left) folds the outcome into the
+    host record. Items keep their input order and are released once their
+    work is done or `timeout` has passed since it was submitted. With
+    `started`, which returns when a Future's work actually began (None
+    while it is still queued), the timeout counts from then instead, so
+    work waiting behind a saturated worker pool isn't given up on unrun.
+    """
+    pending = deque()
+
+    def deadline(entry) -> Optional[float]:
+        _, future, submitted = entry
+        if started is None:
+            return submitted + timeout
+        began = started(future)
+        return None if began is None else began + timeout
+
+    def expired(entry) -> bool:
+        end = deadline(entry)
+        return end is not None and time.monotonic() >= end
+
+    def release(entry):
+        item, future, _ = entry
+        if future is not None:
+            end = deadline(entry)
+            while end is None and not future.done():
+                wait([future], QUEUE_POLL)
+                end = deadline(entry)
+            apply(item[2], future, 0.0 if end is None else max(0.0, end - time.monotonic()))
+        return item
+
+    for item in results:
+        future = submit(item) if item[2] is not None else None
+        pending.append((item, future, time.monotonic()))
+        while pending and (pending[0][1] is None or pending[0][1].done()
+                           or expired(pending[0])):
+            yield release(pending.popleft())
+    while pending:
+        yield release(pending.popleft())
+
+class AsyncScanEngine:
+    """Connect scanner that keeps many non-blocking probes in flight at once.
+
+    With discovery enabled, each host first gets a liveness check: hosts in
+    the kernel neighbour table count as live, the rest get TCP probes on
+    discovery_ports where any connect or refusal proves the host exists.
+    A host that stays silent on all of them is looked up in the neighbour
+    table again, since the probes themselves make the kernel resolve
+    on-link addresses. Only live hosts get the full port sweep.
+
+    Passing an AdaptiveTimeouts replaces the fixed timeout with one derived
+    from RTTs measured during the scan, and a PacingPolicy puts every probe
+    through a ProbePacer (rate limit, per-subnet/host caps, backoff).
+    """
+
+    def __init__(self, concurrency: int = 512, timeout: float = 0.5,
+                 discovery: bool = False, discovery_ports: Iterable[int] = DISCOVERY_PORTS,
+                 timeouts: Optional[AdaptiveTimeouts] = None,
+                 pacing: Optional[PacingPolicy] = None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.timeouts = timeouts
+        self.pacing = pacing
+        self.discovery = discovery
+        self.discovery_ports = list(discovery_ports)
+        self._neighbours: Set[str] = set()
+        self._neighbours_read = 0.0
+        self._pacer: Optional[ProbePacer] = None
+        self.probes_done = 0
+
+    async def probe_state(self, ip: str, port: int, semaphore: asyncio.Semaphore) -> str:
+        """Connect to ip:port and classify the outcome as open, closed, filtered or error."""
+        async with semaphore:
+            if self._pacer is None:
+                state, _ = await self._connect(ip, port)
+                return state
+            async with self._pacer.slot(ip):
+                state, error = await self._connect(ip, port)
+            await self._pacer.report(ip, error)
+            return state
+
+    async def _connect(self, ip: str, port: int) -> Tuple[str, Optional[str]]:
+        """One connect attempt, plus REFUSED/UNREACHABLE when the network said no."""
+        loop = asyncio.get_running_loop()
+        timeout = self.timeouts.timeout(ip) if self.timeouts else self.timeout
+        METRICS.probe_started('tcp')
+        state, latency = FILTERED, None
+        sock = None
+        try:
+            sock = await self._open_socket()
+            started = time.monotonic()
+            await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), timeout)
+            state, latency = OPEN, self._observe(ip, started)
+            return OPEN, None
+        except ConnectionRefusedError:
+            state, latency = CLOSED, self._observe(ip, started)
+            return CLOSED, REFUSED
+        except asyncio.TimeoutError:
+            return FILTERED, None
+        except asyncio.CancelledError:
+            state = CANCELLED
+            raise
+        except OSError as e:
+            if sock is None:
+                state = ERROR
+                return ERROR, None
+            return FILTERED, UNREACHABLE if e.errno in UNREACHABLE_ERRNOS else None
+        finally:
+            if sock is not None:
+                sock.close()
+            METRICS.probe_finished('tcp', state, latency)
+
+    @staticmethod
+    async def _open_socket() -> socket.socket:
+        """A non-blocking TCP socket, backing off while descriptors run out."""
+        for delay in SOCKET_BACKOFF + (None,):
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            except OSError as e:
+                if delay is None or e.errno not in RESOURCE_ERRNOS:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            sock.setblocking(False)
+            return sock
+
+    def _observe(self, ip: str, started: float) -> float:
+        rtt = time.monotonic() - started
+        if self.timeouts:
+            self.timeouts.observe(ip, rtt)
+        return rtt
+
+    async def probe(self, ip: str, port: int, semaphore: asyncio.Semaphore) -> bool:
+        """Return True if a TCP connect to ip:port completes within the timeout."""
+        return await self.probe_state(ip, port, semaphore) == OPEN
+
+    async def scan_host(self, ip: str, ports: List[int], semaphore: asyncio.Semaphore,
+                        discover: bool = False) -> HostResult:
+        """Probe every port on a host concurrently and return the open ones."""
+        known: Dict[int, str] = {}
+        if discover and ip not in self._neighbours:
+            started = time.monotonic()
+            states = await asyncio.gather(
+                *(self.probe_state(ip, port, semaphore) for port in self.discovery_ports)
+            )
+            known.update(zip(self.discovery_ports, states))
+            if all(state == FILTERED for state in states) \
+                    and not self._is_neighbour(ip, since=started):
+                return ip, []
+
+        remaining = [port for port in ports if port not in known]
+        results = await asyncio.gather(
+            *(self.probe_state(ip, port, semaphore) for port in remaining)
+        )
+        known.update(zip(remaining, results))
+        return ip, [port for port in ports if known[port] == OPEN]
+
+    def _is_neighbour(self, ip: str, since: float) -> bool:
+        """Check the neighbour table, re-reading it if it predates `since`."""
+        if self._neighbours_read < since:
+            self._neighbours = read_neighbour_table()
+            self._neighbours_read = time.monotonic()
+        return ip in self._neighbours
+
+    def scan_stream(self, hosts: Iterable[str], ports: List[int]) -> AsyncIterator[HostResult]:
+        """Yield (ip, open_ports) per host as soon as each host finishes.
+
+        Hosts are pulled from the iterable only as in-flight slots free up,
+        so neither the address list nor the results are held in memory.
+        """
+        window = max(1, self.concurrency // max(1, len(ports)))
+        return self.stream_jobs(((ip, ports) for ip in hosts), window, self.discovery)
+
+    async def stream_jobs(self, jobs: Iterable[Tuple[str, List[int]]], window: int,
+                          discover: bool = False) -> AsyncIterator[HostResult]:
+        """Run (ip, ports) jobs with at most `window` hosts in flight."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._pacer = ProbePacer(self.pacing) if self.pacing else None
+        if discover:
+            self._neighbours = read_neighbour_table()
+            self._neighbours_read = time.monotonic()
+        jobs = iter(jobs)
+        pending = set()
+        try:
+            while True:
+                for ip, ports in itertools.islice(jobs, window - len(pending)):
+                    pending.add(asyncio.ensure_future(
+                        self.scan_host(ip, ports, semaphore, discover)
+                    ))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def port_sweep_stream(self, hosts: List[str], ports: List[int]
+                                ) -> AsyncIterator[Optional[Tuple[str, int]]]:
+        """Yield (ip, port) for each open port across a wide port range.
+
+        Probes go out port-major: every host gets ports[0], then every host
+        gets ports[1], and so on. No single host sees a burst of connects,
+        so its rate limits and SYN backlog don't stall the scan, and with
+        ports in likelihood order the common services turn up first.
+        probes_done counts finished probes, and a None heartbeat is yielded
+        about every quarter second so callers can report progress even
+        while nothing is open.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._pacer = ProbePacer(self.pacing) if self.pacing else None
+        self.probes_done = 0
+        jobs = ((ip, port) for port in ports for ip in hosts)
+        pending = {}
+        heartbeat = time.monotonic()
+        try:
+            while True:
+                for ip, port in itertools.islice(jobs, self.concurrency - len(pending)):
+                    task = asyncio.ensure_future(self.probe_state(ip, port, semaphore))
+                    pending[task] = (ip, port)
+                if not pending:
+                    break
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    target = pending.pop(task)
+                    self.probes_done += 1
+                    if task.result() == OPEN:
+                        yield target
+                if time.monotonic() - heartbeat >= 0.25:
+                    heartbeat = time.monotonic()
+                    yield None
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def pair_stream(self, pairs: Iterable[Tuple[str, int]]
+                          ) -> AsyncIterator[Tuple[str, int, str]]:
+        """Probe (ip, port) pairs in the given order, yielding (ip, port, state) as each finishes."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._pacer = ProbePacer(self.pacing) if self.pacing else None
+        pairs = iter(pairs)
+        pending = {}
+        try:
+            while True:
+                for ip, port in itertools.islice(pairs, self.concurrency - len(pending)):
+                    task = asyncio.ensure_future(self.probe_state(ip, port, semaphore))
+                    pending[task] = (ip, port)
+                if not pending:
+                    break
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    ip, port = pending.pop(task)
+                    self.probes_done += 1
+                    yield ip, port, task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def iter_port_sweep(self, hosts: List[str], ports: List[int]
+                        ) -> Iterator[Optional[Tuple[str, int]]]:
+        """Blocking generator over port_sweep_stream."""
+        return self._drive(self.port_sweep_stream(hosts, ports))
+
+    def _drive(self, stream: AsyncIterator) -> Iterator:
+        """Blocking generator over an async result stream, on a private event loop."""
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(stream.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(stream.aclose())
+            loop.close()
+
+    def iter_scan(self, hosts: Iterable[str], ports: List[int] = COMMON_PORTS) -> Iterator[HostResult]:
+        """Blocking generator over scan_stream."""
+        return self._drive(self.scan_stream(hosts, ports))
+
+    def iter_verify(self, host_ports: Iterable[Tuple[str, List[int]]]) -> Iterator[HostResult]:
+        """Re-probe exact (ip, ports) pairs, skipping discovery since the hosts are known."""
+        return self._drive(self.stream_jobs(host_ports, self.concurrency))
+
+    def scan(self, hosts: Iterable[str], ports: List[int] = COMMON_PORTS) -> Dict[str, List[int]]:
+        """Run a full sweep and collect every host's open ports."""
+        return dict(self.iter_scan(hosts, ports))
@@ -0,0 +1,313 @@
+import bisect
+import json
+import socket
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _read_varints(data: bytes) -> Iterator[int]:
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            yield value
+            value = shift = 0
+
+class RunBitmap:
+    """Set of epoch numbers stored as sorted runs of consecutive epochs.
+
+    A port that stays open for a thousand scans is one run, and encode()
+    writes each run as two varints (gap since the previous run, length),
+    so the blob grows with the number of state changes, not of scans.
+    """
+
+    __slots__ = ('runs',)
+
+    def __init__(self, runs: Optional[List[List[int]]] = None):
+        self.runs: List[List[int]] = runs or []  # [start, length]
+
+    def add(self, epoch: int):
+        if self.runs:
+            start, length = self.runs[-1]
+            if epoch == start + length:
+                self.runs[-1][1] += 1
+                return
+            if epoch < start + length:
+                if epoch not in self:
+                    # Out-of-order epoch: rare, so just rebuild the runs
+                    self.runs = RunBitmap.from_epochs(sorted([*self, epoch])).runs
+                return
+        self.runs.append([epoch, 1])
+
+    def fill(self, epoch: int):
+        """Add epoch and every epoch between it and the last run."""
+        if not self.runs or epoch < sum(self.runs[-1]):
+            self.add(epoch)
+            return
+        self.runs[-1][1] = epoch - self.runs[-1][0] + 1
+
+    @classmethod
+    def from_epochs(cls, epochs: Iterable[int]) -> 'RunBitmap':
+        bitmap = cls()
+        for epoch in epochs:
+            bitmap.add(epoch)
+        return bitmap
+
+    def __contains__(self, epoch: int) -> bool:
+        index = bisect.bisect_right(self.runs, [epoch, float('inf')]) - 1
+        return index >= 0 and epoch < self.runs[index][0] + self.runs[index][1]
+
+    def __iter__(self) -> Iterator[int]:
+        for start, length in self.runs:
+            yield from range(start, start + length)
+
+    def __len__(self) -> int:
+        return sum(length for _, length in self.runs)
+
+    def encode(self) -> bytes:
+        out = bytearray()
+        previous_end = 0
+        for start, length in self.runs:
+            out += _varint(start - previous_end) + _varint(length)
+            previous_end = start + length
+        return bytes(out)
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'RunBitmap':
+        runs = []
+        previous_end = 0
+        values = _read_varints(data)
+        for gap, length in zip(values, values):
+            runs.append([previous_end + gap, length])
+            previous_end += gap + length
+        return cls(runs)
+
+def _address(ip: str) -> int:
+    return int.from_bytes(socket.inet_aton(ip), 'big')
+
+def _interval_runs(intervals: Iterable[Tuple[int, int]]) -> RunBitmap:
+    """Sorted, disjoint inclusive intervals as a RunBitmap of addresses."""
+    return RunBitmap([[start, end - start + 1] for start, end in intervals])
+
+class ScanHistory:
+    """Per host:port open/closed timeline across scan epochs, in SQLite.
+
+    Every completed scan is an epoch that remembers the address intervals
+    and ports it covered. Only host:port pairs that were ever open get a
+    row, holding a RunBitmap of the epochs they were open in, so a covered
+    epoch whose bit is missing means closed. Queries only count epochs that
+    actually covered the host and port, so an open pair's run is stretched
+    across epochs that didn't cover it; scans of other subnets or port sets
+    in between don't split it.
+
+    Target specs and port sets are stored once each, run-encoded like the
+    bitmaps, and epochs refer to them by id; an epoch row is a few
+    integers, and the epochs covering a host:port come from an index on
+    those ids.
+    """
+
+    def __init__(self, path: str = 'scan_state.db'):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        # Decoded target/port sets by id; rows are never changed once written
+        self._target_sets: Dict[int, Tuple[RunBitmap, RunBitmap]] = {}
+        self._port_sets: Dict[int, RunBitmap] = {}
+        with self._lock, self._conn:
+            columns = {row[1] for row in self._conn.execute('PRAGMA table_info(scan_epochs)')}
+            if 'targets' in columns:
+                self._conn.execute('ALTER TABLE scan_epochs RENAME TO scan_epochs_json')
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS scan_target_sets (
+                    id INTEGER PRIMARY KEY,
+                    include BLOB NOT NULL,
+                    exclude BLOB NOT NULL,
+                    UNIQUE (include, exclude)
+                );
+                CREATE TABLE IF NOT EXISTS scan_port_sets (
+                    id INTEGER PRIMARY KEY,
+                    ports BLOB NOT NULL UNIQUE
+                );
+                CREATE TABLE IF NOT EXISTS scan_epochs (
+                    epoch INTEGER PRIMARY KEY,
+                    finished REAL NOT NULL,
+                    targets_id INTEGER NOT NULL REFERENCES scan_target_sets (id),
+                    ports_id INTEGER NOT NULL REFERENCES scan_port_sets (id)
+                );
+                CREATE INDEX IF NOT EXISTS scan_epochs_scope
+                    ON scan_epochs (targets_id, ports_id, finished);
+                CREATE TABLE IF NOT EXISTS port_history (
+                    ip TEXT NOT NULL,
+                    port INTEGER NOT NULL,
+                    epochs BLOB NOT NULL,
+                    PRIMARY KEY (ip, port)
+                );
+            ''')
+            legacy = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'scan_epochs_json'"
+            ).fetchone()
+            if legacy:
+                self._migrate_json_epochs()
+
+    def _migrate_json_epochs(self):
+        """Move epochs that stored their targets and ports as JSON onto set ids."""
+        ids = {}
+        rows = self._conn.execute('SELECT epoch, finished, targets, ports FROM scan_epochs_json')
+        migrated = []
+        for epoch, finished, targets, ports in rows:
+            if (targets, ports) not in ids:
+                intervals = json.loads(targets)
+                ids[(targets, ports)] = (
+                    self._target_set_id(intervals['include'], intervals['exclude']),
+                    self._port_set_id(json.loads(ports))
+                )
+            migrated.append((epoch, finished, *ids[(targets, ports)]))
+        self._conn.executemany(
+            'INSERT INTO scan_epochs (epoch, finished, targets_id, ports_id) VALUES (?, ?, ?, ?)',
+            migrated
+        )
+        self._conn.execute('DROP TABLE scan_epochs_json')
+
+    def _target_set_id(self, include, exclude) -> int:
+        key = (_interval_runs(include).encode(), _interval_runs(exclude).encode())
+        self._conn.execute('INSERT OR IGNORE INTO scan_target_sets (include, exclude) VALUES (?, ?)', key)
+        return self._conn.execute(
+            'SELECT id FROM scan_target_sets WHERE include = ? AND exclude = ?', key
+        ).fetchone()[0]
+
+    def _port_set_id(self, ports: Iterable[int]) -> int:
+        key = RunBitmap.from_epochs(sorted(set(ports))).encode()
+        self._conn.execute('INSERT OR IGNORE INTO scan_port_sets (ports) VALUES (?)', (key,))
+        return self._conn.execute('SELECT id FROM scan_port_sets WHERE ports = ?', (key,)).fetchone()[0]
+
+    def _load_sets(self):
+        """Decode target/port sets written since the last call; caller holds the lock."""
+        rows = self._conn.execute('SELECT id, include, exclude FROM scan_target_sets WHERE id > ?',
+                                  (max(self._target_sets, default=0),))
+        for set_id, include, exclude in rows:
+            self._target_sets[set_id] = (RunBitmap.decode(include), RunBitmap.decode(exclude))
+        rows = self._conn.execute('SELECT id, ports FROM scan_port_sets WHERE id > ?',
+                                  (max(self._port_sets, default=0),))
+        for set_id, ports in rows:
+            self._port_sets[set_id] = RunBitmap.decode(ports)
+
+    def _covers(self, targets_id: int, ports_id: int, address: int, port: int) -> bool:
+        """Whether an epoch with these target and port sets probed address:port."""
+        include, exclude = self._target_sets[targets_id]
+        return port in self._port_sets[ports_id] and address in include and address not in exclude
+
+    def record_epoch(self, spec, ports: Iterable[int], results: Iterable[Tuple[str, List[int]]],
+                     timestamp: Optional[float] = None) -> int:
+        """Store one finished scan of spec/ports; results need only list hosts with open ports."""
+        open_pairs = [(ip, port) for ip, open_ports in results for port in open_ports]
+        with self._lock, self._conn:
+            epoch = self._conn.execute(
+                'INSERT INTO scan_epochs (finished, targets_id, ports_id) VALUES (?, ?, ?)',
+                (timestamp or time.time(), self._target_set_id(spec.include, spec.exclude),
+                 self._port_set_id(ports))
+            ).lastrowid
+            bitmaps = {}
+            ips = sorted({ip for ip, _ in open_pairs})
+            for i in range(0, len(ips), 500):
+                chunk = ips[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT ip, port, epochs FROM port_history WHERE ip IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                for ip, port, blob in rows:
+                    bitmaps[(ip, port)] = RunBitmap.decode(blob)
+            gaps = {pair: sum(bitmap.runs[-1]) for pair, bitmap in bitmaps.items()
+                    if bitmap.runs and sum(bitmap.runs[-1]) < epoch}
+            # Latest epoch of each target/port set scanned since the oldest gap
+            between = []
+            if gaps:
+                self._load_sets()
+                between = self._conn.execute(
+                    'SELECT targets_id, ports_id, max(epoch) FROM scan_epochs '
+                    'WHERE epoch >= ? AND epoch < ? GROUP BY targets_id, ports_id',
+                    (min(gaps.values()), epoch)
+                ).fetchall()
+            updates = []
+            for ip, port in open_pairs:
+                bitmap = bitmaps.setdefault((ip, port), RunBitmap())
+                start = gaps.get((ip, port))
+                if start is not None and not any(
+                        self._covers(targets_id, ports_id, _address(ip), port)
+                        for targets_id, ports_id, latest in between
+                        if latest >= start):
+                    # Nothing probed the pair since it was last open
+                    bitmap.fill(epoch)
+                else:
+                    bitmap.add(epoch)
+                updates.append((ip, port, bitmap.encode()))
+            self._conn.executemany('''
+                INSERT INTO port_history (ip, port, epochs) VALUES (?, ?, ?)
+                ON CONFLICT (ip, port) DO UPDATE SET epochs = excluded.epochs
+            ''', updates)
+        return epoch
+
+    def _covering(self, ip: str, port: int, since: Optional[float]) -> List[Tuple[int, float]]:
+        """(epoch, finished) for every epoch that probed port on ip."""
+        address = _address(ip)
+        covering = []
+        with self._lock:
+            self._load_sets()
+            target_ids = [set_id for set_id, (include, exclude) in self._target_sets.items()
+                          if address in include and address not in exclude]
+            port_ids = [set_id for set_id, ports in self._port_sets.items() if port in ports]
+            for i in range(0, len(target_ids), 400):
+                for j in range(0, len(port_ids), 400):
+                    targets, ports = target_ids[i:i + 400], port_ids[j:j + 400]
+                    covering += self._conn.execute(
+                        f"SELECT epoch, finished FROM scan_epochs "
+                        f"WHERE targets_id IN ({','.join('?' * len(targets))}) "
+                        f"AND ports_id IN ({','.join('?' * len(ports))}) AND finished >= ?",
+                        targets + ports + [since or 0]
+                    ).fetchall()
+        return sorted(covering)
+
+    def _bitmap(self, ip: str, port: int) -> RunBitmap:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT epochs FROM port_history WHERE ip = ? AND port = ?', (ip, port)
+            ).fetchone()
+        return RunBitmap.decode(row[0]) if row else RunBitmap()
+
+    def change_points(self, ip: str, port: int, since: Optional[float] = None) -> List[Dict]:
+        """Scans at which ip:port was first seen open or closed, oldest first."""
+        bitmap = self._bitmap(ip, port)
+        changes = []
+        state = None
+        for epoch, finished in self._covering(ip, port, since):
+            is_open = epoch in bitmap
+            if is_open != state:
+                if state is not None or is_open:
+                    changes.append({'epoch': epoch, 'time': finished,
+                                    'state': 'open' if is_open else 'closed'})
+                state = is_open
+        return changes
+
+    def uptime(self, ip: str, port: int, since: Optional[float] = None) -> Dict:
+        """Share of covering scans in which ip:port was open."""
+        bitmap = self._bitmap(ip, port)
+        covering = self._covering(ip, port, since)
+        open_epochs = [finished for epoch, finished in covering if epoch in bitmap]
+        return {
+            'ip': ip,
+            'port': port,
+            'scans': len(covering),
+            'open_scans': len(open_epochs),
+            'uptime': round(len(open_epochs) / len(covering), 4) if covering else None,
+            'first_seen': open_epochs[0] if open_epochs else None,
+            'last_seen': open_epochs[-1] if open_epochs else None
+        }
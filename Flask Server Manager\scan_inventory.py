@@ -0,0 +1,225 @@
+import sqlite3
+import time
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from scan_engine import HostRecord
+from scan_resolver import UNKNOWN_HOSTNAME
+
+class AssetInventory:
+    """Persistent hosts and services from past scans, indexed for lookups.
+
+    Services are indexed by port, by service name and by product, and hosts
+    by hostname and last-seen time, so "who exposes MySQL" is an index scan
+    rather than a rescan. Scan results are upserted in batches; probed
+    ports that are no longer open are dropped from the services of hosts
+    that answered. A host with nothing open may just be down, so its rows
+    are kept and age out by last_seen.
+    TLS certificate subject and expiry are kept on the service row, so
+    expiry reports survive restarts and agree across workers.
+    """
+
+    def __init__(self, path: str = 'scan_state.db', batch_size: int = 256):
+        self.path = path
+        self.batch_size = batch_size
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        with self._lock, self._conn:
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS inventory_hosts (
+                    ip TEXT PRIMARY KEY,
+                    hostname TEXT,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS inventory_services (
+                    ip TEXT NOT NULL,
+                    port INTEGER NOT NULL,
+                    protocol TEXT NOT NULL,
+                    service TEXT,
+                    product TEXT,
+                    version TEXT,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL,
+                    tls_subject TEXT,
+                    tls_fingerprint TEXT,
+                    tls_not_after REAL,
+                    PRIMARY KEY (ip, protocol, port)
+                );
+                CREATE INDEX IF NOT EXISTS inventory_hosts_hostname ON inventory_hosts (hostname);
+                CREATE INDEX IF NOT EXISTS inventory_hosts_last_seen ON inventory_hosts (last_seen);
+                CREATE INDEX IF NOT EXISTS inventory_services_port ON inventory_services (port, protocol);
+                CREATE INDEX IF NOT EXISTS inventory_services_service
+                    ON inventory_services (service, product, version);
+                CREATE INDEX IF NOT EXISTS inventory_services_product
+                    ON inventory_services (lower(product));
+            ''')
+            # Databases created before certificates were tracked
+            columns = {row[1] for row in self._conn.execute('PRAGMA table_info(inventory_services)')}
+            for column, kind in (('tls_subject', 'TEXT'), ('tls_fingerprint', 'TEXT'),
+                                 ('tls_not_after', 'REAL')):
+                if column not in columns:
+                    self._conn.execute(f'ALTER TABLE inventory_services ADD COLUMN {column} {kind}')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS inventory_services_tls_not_after '
+                               'ON inventory_services (tls_not_after)')
+
+    def upsert(self, items: Iterable[HostRecord], probed_ports: Iterable[int],
+               protocol: str = 'tcp', timestamp: Optional[float] = None):
+        """Write one batch of scan results in a single transaction."""
+        timestamp = timestamp or time.time()
+        probed_ports = list(probed_ports)
+        hosts, services, closed = [], [], []
+        for ip, open_ports, record in items:
+            # No record means nothing answered as open: the host may just be
+            # down or filtered this time, so leave its rows alone
+            if record is not None:
+                hostname = record.get('hostname')
+                hosts.append((ip, None if hostname == UNKNOWN_HOSTNAME else hostname,
+                              timestamp, timestamp))
+                details = {info['port']: info for info in record.get('services') or ()}
+                certs = {cert['port']: cert for cert in record.get('tls') or ()}
+                for port in open_ports:
+                    info = details.get(port, {})
+                    services.append((ip, port, protocol, info.get('service'), info.get('product'),
+                                     info.get('version'), timestamp, timestamp)
+                                    + self._certificate(certs.get(port)))
+                open_set = set(open_ports)
+                closed.extend((ip, protocol, port) for port in probed_ports if port not in open_set)
+        with self._lock, self._conn:
+            known = set()
+            if closed:
+                ips = sorted({ip for ip, _, _ in closed})
+                for i in range(0, len(ips), 500):
+                    chunk = ips[i:i + 500]
+                    known.update(row[0] for row in self._conn.execute(
+                        f"SELECT DISTINCT ip FROM inventory_services "
+                        f"WHERE ip IN ({','.join('?' * len(chunk))})", chunk
+                    ))
+            self._conn.executemany('''
+                INSERT INTO inventory_hosts (ip, hostname, first_seen, last_seen) VALUES (?, ?, ?, ?)
+                ON CONFLICT (ip) DO UPDATE SET
+                    last_seen = excluded.last_seen,
+                    hostname = coalesce(excluded.hostname, inventory_hosts.hostname)
+            ''', hosts)
+            self._conn.executemany('''
+                INSERT INTO inventory_services
+                    (ip, port, protocol, service, product, version, first_seen, last_seen,
+                     tls_subject, tls_fingerprint, tls_not_after)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (ip, protocol, port) DO UPDATE SET
+                    last_seen = excluded.last_seen,
+                    service = coalesce(excluded.service, inventory_services.service),
+                    product = coalesce(excluded.product, inventory_services.product),
+                    version = coalesce(excluded.version, inventory_services.version),
+                    tls_subject = coalesce(excluded.tls_subject, inventory_services.tls_subject),
+                    tls_fingerprint = coalesce(excluded.tls_fingerprint,
+                                               inventory_services.tls_fingerprint),
+                    tls_not_after = coalesce(excluded.tls_not_after, inventory_services.tls_not_after)
+            ''', services)
+            self._conn.executemany(
+                'DELETE FROM inventory_services WHERE ip = ? AND protocol = ? AND port = ?',
+                [entry for entry in closed if entry[0] in known]
+            )
+
+    @staticmethod
+    def _certificate(cert: Optional[Dict]) -> Tuple[Optional[str], Optional[str], Optional[float]]:
+        """(subject, fingerprint, not_after) columns for a TlsInspector result."""
+        if not cert or 'not_after' not in cert:
+            return None, None, None
+        names = cert.get('alt_names') or [None]
+        subject = cert.get('subject', {}).get('commonName') or names[0]
+        return subject, cert.get('fingerprint'), datetime.fromisoformat(cert['not_after']).timestamp()
+
+    def iter_upserted(self, results: Iterable[HostRecord], probed_ports: Iterable[int],
+                      protocol: str = 'tcp') -> Iterator[HostRecord]:
+        """Pass scan results through, upserting them every batch_size hosts."""
+        probed_ports = list(probed_ports)
+        batch = []
+        try:
+            for item in results:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self.upsert(batch, probed_ports, protocol)
+                    batch = []
+                yield item
+        finally:
+            # A cancelled scan still keeps what it found so far
+            if batch:
+                self.upsert(batch, probed_ports, protocol)
+
+    def hosts(self, port: Optional[int] = None, service: Optional[str] = None,
+              hostname: Optional[str] = None, seen_since: Optional[float] = None,
+              protocol: Optional[str] = None, limit: int = 1000) -> List[Dict]:
+        """Hosts matching every given filter, most recently seen first.
+
+        service matches the fingerprinted service name or product
+        ('mysql' finds MySQL and MariaDB); a hostname ending in '*' is a
+        prefix match.
+        """
+        joins, where, params = '', [], []
+        if port is not None or service or protocol:
+            joins = 'JOIN inventory_services s ON s.ip = h.ip'
+        if port is not None:
+            where.append('s.port = ?')
+            params.append(port)
+        if protocol:
+            where.append('s.protocol = ?')
+            params.append(protocol)
+        if service:
+            where.append('(s.service = ? OR lower(s.product) = ?)')
+            params += [service.lower(), service.lower()]
+        if hostname:
+            if hostname.endswith('*'):
+                prefix = hostname[:-1]
+                where.append('h.hostname >= ? AND h.hostname < ?')
+                params += [prefix, prefix + '\U0010ffff']
+            else:
+                where.append('h.hostname = ?')
+                params.append(hostname)
+        if seen_since is not None:
+            where.append('h.last_seen >= ?')
+            params.append(seen_since)
+        query = f'SELECT DISTINCT h.ip, h.hostname, h.first_seen, h.last_seen FROM inventory_hosts h {joins}'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY h.last_seen DESC LIMIT ?'
+        with self._lock:
+            rows = self._conn.execute(query, params + [limit]).fetchall()
+            hosts = [{'ip': ip, 'hostname': name, 'first_seen': first, 'last_seen': last,
+                      'services': self._services(ip)} for ip, name, first, last in rows]
+        return hosts
+
+    def host(self, ip: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT hostname, first_seen, last_seen FROM inventory_hosts WHERE ip = ?', (ip,)
+            ).fetchone()
+            if row is None:
+                return None
+            return {'ip': ip, 'hostname': row[0], 'first_seen': row[1], 'last_seen': row[2],
+                    'services': self._services(ip)}
+
+    def expiring(self, days: int = 30, limit: int = 1000) -> List[Dict]:
+        """Certificates on known services expiring within `days`, soonest first."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT ip, port, protocol, tls_subject, tls_fingerprint, tls_not_after, last_seen
+                FROM inventory_services WHERE tls_not_after <= ?
+                ORDER BY tls_not_after LIMIT ?
+            ''', (now + days * 86400, limit)).fetchall()
+        return [{
+            'ip': ip, 'port': port, 'protocol': protocol, 'subject': subject,
+            'fingerprint': fingerprint,
+            'not_after': datetime.fromtimestamp(not_after, timezone.utc).isoformat(),
+            'expires_in_days': int((not_after - now) // 86400),
+            'last_seen': last_seen
+        } for ip, port, protocol, subject, fingerprint, not_after, last_seen in rows]
+
+    def _services(self, ip: str) -> List[Dict]:
+        rows = self._conn.execute('''
+            SELECT port, protocol, service, product, version, first_seen, last_seen
+            FROM inventory_services WHERE ip = ? ORDER BY protocol, port
+        ''', (ip,)).fetchall()
+        return [dict(zip(('port', 'protocol', 'service', 'product', 'version',
+                          'first_seen', 'last_seen'), row)) for row in rows]
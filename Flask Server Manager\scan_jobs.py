@@ -0,0 +1,136 @@
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from threading import Event, Lock
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from scan_engine import HostRecord
+from scan_results import HostPortTable
+
+QUEUED, RUNNING, DONE, CANCELLED, FAILED = 'queued', 'running', 'done', 'cancelled', 'failed'
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+class JobQueueFull(Exception):
+    """Raised when too many scan jobs are already queued or running."""
+
+@dataclass
+class ScanJob:
+    id: str
+    key: Hashable
+    total: int
+    protocol: str = 'tcp'
+    status: str = QUEUED
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    probed: int = 0
+    open: int = 0
+    error: Optional[str] = None
+    results: HostPortTable = field(default_factory=HostPortTable)
+    cancel_event: Event = field(default_factory=Event)
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'protocol': self.protocol,
+            'status': self.status,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'probed': self.probed,
+            'open': self.open,
+            'remaining': max(0, self.total - self.probed),
+            'total': self.total,
+            'error': self.error
+        }
+
+class ScanJobManager:
+    """Runs scans on a bounded worker pool instead of the request thread.
+
+    Submitting a key that matches a queued or running job returns that job
+    rather than starting a second sweep. At most max_workers scans run at
+    once and at most max_queued wait behind them; beyond that submit()
+    raises JobQueueFull.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queued: int = 8, max_history: int = 100):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='scan-job')
+        self._jobs: OrderedDict = OrderedDict()
+        self._active: Dict[Hashable, ScanJob] = {}
+        self._lock = Lock()
+
+    def submit(self, key: Hashable, total: int,
+               scan: Callable[[], Iterable[HostRecord]],
+               protocol: str = 'tcp') -> Tuple[ScanJob, bool]:
+        """Queue scan() unless an identical job is active; returns (job, created)."""
+        with self._lock:
+            existing = self._active.get(key)
+            if existing is not None:
+                return existing, False
+            if len(self._active) >= self.max_workers + self.max_queued:
+                raise JobQueueFull('Too many scans queued, try again later')
+
+            job = ScanJob(id=uuid.uuid4().hex, key=key, total=total, protocol=protocol)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._trim_history()
+        self._executor.submit(self._run, job, scan)
+        return job, True
+
+    def get(self, job_id: str) -> Optional[ScanJob]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[ScanJob]:
+        """Ask a job to stop; queued jobs never start, running ones stop at the next host."""
+        job = self._jobs.get(job_id)
+        if job is not None and job.status in ACTIVE_STATES:
+            job.cancel_event.set()
+        return job
+
+    def list(self) -> List[ScanJob]:
+        return list(self._jobs.values())
+
+    def _run(self, job: ScanJob, scan):
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        results = None
+        try:
+            results = iter(scan())
+            for ip, open_ports, record in results:
+                job.probed += 1
+                if record is not None:
+                    job.open += 1
+                    job.results.add_record(record)
+                if job.cancel_event.is_set():
+                    break
+            self._finish(job, CANCELLED if job.cancel_event.is_set() else DONE)
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, FAILED)
+        finally:
+            # Closing the generator cancels any probes still in flight
+            close = getattr(results, 'close', None)
+            if close:
+                close()
+
+    def _finish(self, job: ScanJob, status: str):
+        job.status = status
+        job.finished = time.time()
+        with self._lock:
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+
+    def _trim_history(self):
+        while len(self._jobs) > self.max_history:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status in ACTIVE_STATES:
+                break
+            del self._jobs[oldest_id]
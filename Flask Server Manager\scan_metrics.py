@@ -0,0 +1,94 @@
+import time
+from threading import Lock
+from typing import Optional, Tuple
+
+# Scan workers on other nodes may run without prometheus_client; metrics are then no-ops
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge,
+                                   Histogram, generate_latest)
+except ImportError:
+    REGISTRY = None
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class RateMeter:
+    """Events per second over a sliding window of one-second buckets."""
+
+    def __init__(self, window: int = 10):
+        self.window = window
+        self._buckets = [0] * window
+        self._seconds = [0] * window
+        self._lock = Lock()
+
+    def add(self, count: int = 1, now: Optional[float] = None):
+        second = int(now if now is not None else time.time())
+        slot = second % self.window
+        with self._lock:
+            if self._seconds[slot] > second:
+                return  # Too old for the window
+            if self._seconds[slot] != second:
+                self._seconds[slot] = second
+                self._buckets[slot] = 0
+            self._buckets[slot] += count
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """Average over the last `window` complete seconds."""
+        second = int(now if now is not None else time.time())
+        with self._lock:
+            total = sum(count for count, at in zip(self._buckets, self._seconds)
+                        if second - self.window <= at < second)
+        return total / self.window
+
+class ScanMetrics:
+    """Scanner self-instrumentation exported through prometheus_client."""
+
+    def __init__(self, registry=None):
+        self.enabled = REGISTRY is not None
+        self.rate = RateMeter()
+        if not self.enabled:
+            return
+        self.registry = registry or REGISTRY
+        self.probes_sent = Counter('scanner_probes_sent_total', 'Probes sent',
+                                   ['protocol'], registry=self.registry)
+        self.probe_results = Counter('scanner_probe_results_total',
+                                     'Finished probes by outcome (open/closed/filtered/error/cancelled)',
+                                     ['protocol', 'state'], registry=self.registry)
+        self.probe_rate = Gauge('scanner_probes_per_second',
+                                'Probes sent per second over the last 10 seconds',
+                                registry=self.registry)
+        self.probe_rate.set_function(self.rate.rate)
+        self.inflight = Gauge('scanner_inflight_sockets',
+                              'Probes awaiting an outcome (open sockets, for TCP)',
+                              ['protocol'], registry=self.registry)
+        self.connect_latency = Histogram('scanner_connect_latency_seconds',
+                                         'Time for a TCP connect to be accepted or refused',
+                                         buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.dns_time = Histogram('scanner_dns_lookup_seconds',
+                                  'Reverse DNS lookup time, cache misses only',
+                                  registry=self.registry)
+
+    def probe_started(self, protocol: str = 'tcp', retransmit: bool = False):
+        self.rate.add()
+        if self.enabled:
+            self.probes_sent.labels(protocol).inc()
+            if not retransmit:
+                self.inflight.labels(protocol).inc()
+
+    def probe_finished(self, protocol: str, state: str, latency: Optional[float] = None):
+        if self.enabled:
+            self.inflight.labels(protocol).dec()
+            self.probe_results.labels(protocol, state).inc()
+            if latency is not None:
+                self.connect_latency.observe(latency)
+
+    def dns_lookup(self, seconds: float):
+        if self.enabled:
+            self.dns_time.observe(seconds)
+
+    def render(self) -> Optional[Tuple[bytes, str]]:
+        """(body, content type) for a /metrics response, or None without prometheus_client."""
+        if not self.enabled:
+            return None
+        return generate_latest(self.registry), CONTENT_TYPE_LATEST
+
+METRICS = ScanMetrics()
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
+from typing import Deque, Dict, Optional
+
+# Connect errors fed back to the pacer
+REFUSED, UNREACHABLE = 'refused', 'unreachable'
+
+@dataclass
+class PacingPolicy:
+    """Limits for probe dispatch; rate is probes/s across the scan, 0 for unlimited."""
+    rate: float = 0
+    burst: int = 0
+    per_subnet: int = 128
+    per_host: int = 16
+    min_per_subnet: int = 8
+    backoff_window: int = 64
+    backoff_threshold: float = 0.8
+    # Closed ports answer with RST too, so refusals only count when asked to
+    backoff_on_refused: bool = False
+
+    def split(self, parts: int) -> 'PacingPolicy':
+        """Share of this policy for one of `parts` independent scanners."""
+        return replace(self, rate=self.rate / parts if self.rate else 0,
+                       burst=self.burst // parts if self.burst else 0)
+
+class TokenBucket:
+    """Asyncio token bucket: acquire() waits until a token is available."""
+
+    def __init__(self, rate: float, burst: int = 0):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate / 10))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class _Limiter:
+    """Counting semaphore whose limit can move while probes are waiting."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.active < self.limit)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+
+    async def release(self):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    async def set_limit(self, limit: int):
+        async with self._condition:
+            self.limit = limit
+            self._condition.notify_all()
+
+class _SubnetState:
+    def __init__(self, policy: PacingPolicy):
+        self.limiter = _Limiter(policy.per_subnet)
+        self.outcomes: Deque[bool] = deque(maxlen=policy.backoff_window)
+
+class ProbePacer:
+    """Global rate limit, per-/24 and per-host caps, and backoff on failing subnets.
+
+    A subnet whose recent probes mostly end in EHOSTUNREACH/ENETUNREACH
+    (and ECONNREFUSED, with backoff_on_refused) has its concurrency cap
+    halved, down to min_per_subnet; each healthy window afterwards raises
+    it by one again.
+    """
+
+    def __init__(self, policy: PacingPolicy):
+        self.policy = policy
+        self.bucket = TokenBucket(policy.rate, policy.burst) if policy.rate else None
+        self._subnets: Dict[str, _SubnetState] = {}
+        self._hosts: Dict[str, _Limiter] = {}
+
+    def _subnet(self, ip: str) -> _SubnetState:
+        key = ip.rsplit('.', 1)[0]
+        state = self._subnets.get(key)
+        if state is None:
+            state = self._subnets[key] = _SubnetState(self.policy)
+        return state
+
+    @asynccontextmanager
+    async def slot(self, ip: str):
+        """Hold a dispatch slot for one probe to ip."""
+        subnet = self._subnet(ip)
+        host = self._hosts.get(ip)
+        if host is None:
+            host = self._hosts[ip] = _Limiter(self.policy.per_host)
+        await subnet.limiter.acquire()
+        try:
+            await host.acquire()
+            try:
+                if self.bucket:
+                    await self.bucket.acquire()
+                yield
+            finally:
+                await host.release()
+                if host.active == 0 and host.waiting == 0:
+                    self._hosts.pop(ip, None)
+        finally:
+            await subnet.limiter.release()
+
+    async def report(self, ip: str, error: Optional[str]):
+        """Feed back how a probe ended: None, REFUSED or UNREACHABLE."""
+        failed = error == UNREACHABLE or (error == REFUSED and self.policy.backoff_on_refused)
+        subnet = self._subnet(ip)
+        subnet.outcomes.append(failed)
+        if len(subnet.outcomes) < subnet.outcomes.maxlen:
+            return
+        failure_rate = sum(subnet.outcomes) / len(subnet.outcomes)
+        limit = subnet.limiter.limit
+        if failure_rate >= self.policy.backoff_threshold:
+            limit = max(self.policy.min_per_subnet, limit // 2)
+        else:
+            limit = min(self.policy.per_subnet, limit + 1)
+        subnet.outcomes.clear()
+        if limit != subnet.limiter.limit:
+            await subnet.limiter.set_limit(limit)
+
+    def subnet_limits(self) -> Dict[str, int]:
+        return {key: state.limiter.limit for key, state in self._subnets.items()}
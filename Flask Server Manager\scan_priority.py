@@ -0,0 +1,261 @@
+import asyncio
+import heapq
+import ipaddress
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+from scan_engine import OPEN, CLOSED, FILTERED, ERROR
+from scan_results import HostPortTable
+from scan_state import ScanStateStore
+from scan_targets import PORT_LIKELIHOOD
+
+PORT_RANK = {port: rank for rank, port in enumerate(PORT_LIKELIHOOD)}
+KNOWN_OPEN_PRIOR = 0.99
+
+def _subnet(ip: str) -> int:
+    return int(ipaddress.IPv4Address(ip)) >> 8
+
+def _by_probability(item) -> float:
+    return -item[0]
+
+class HitModel:
+    """Estimated chance that ip:port is open, from what the state store already knows.
+
+    P(open) = P(host live) * P(port open | live host in its /24). A host
+    with any known-open port counts as live; otherwise liveness is the
+    share of known-live hosts in its /24. Per-subnet port rates are
+    smoothed towards the fleet-wide rate for that port, which falls back
+    to PORT_LIKELIHOOD rank when there is no history at all.
+    """
+
+    def __init__(self, known: Dict[str, List[int]]):
+        self.known = known
+        self.live_by_subnet = Counter(_subnet(ip) for ip in known)
+        self.open_by_subnet = Counter((_subnet(ip), port) for ip, ports in known.items()
+                                      for port in ports)
+        self.open_by_port = Counter(port for ports in known.values() for port in ports)
+        self.ports_by_subnet = defaultdict(set)
+        for subnet, port in self.open_by_subnet:
+            self.ports_by_subnet[subnet].add(port)
+
+    def fleet_rate(self, port: int) -> float:
+        rank = PORT_RANK.get(port, len(PORT_LIKELIHOOD))
+        return (self.open_by_port[port] + 1 / (rank + 2)) / (len(self.known) + 1)
+
+    def port_rate(self, subnet: int, port: int) -> float:
+        return (self.open_by_subnet[(subnet, port)] + 2 * self.fleet_rate(port)) \
+            / (self.live_by_subnet[subnet] + 2)
+
+    def live_rate(self, subnet: int) -> float:
+        return (self.live_by_subnet[subnet] + 1) / 256
+
+# Tiers: known-open services, other ports of known-live hosts, unknown hosts
+KNOWN_OPEN, KNOWN_LIVE, UNKNOWN = 0, 1, 2
+# (probability, size, pairs factory, tier)
+Group = Tuple[float, int, Callable[[], Iterator[Tuple[str, int]]], int]
+
+class DeadlineScanner:
+    """Best-effort scan that stops at a wall-clock budget, most likely hits first.
+
+    Targets are split into groups of equal estimated hit probability:
+    known-open services first, then the other ports of known-live hosts,
+    then every (/24, port) bucket of unknown hosts. Groups are probed tier
+    by tier, in descending probability within each tier. They are produced
+    lazily by merging per-host and per-subnet port rankings, so planning a
+    wide spec with many ports costs next to nothing before the budget
+    starts running. When the budget runs out, in-flight probes are
+    cancelled and the open ports found so far come back with a coverage
+    report, including the share of expected open services that was probed.
+    """
+
+    def __init__(self, engine, store: ScanStateStore):
+        self.engine = engine
+        self.store = store
+
+    def plan(self, spec, ports: List[int]) -> Iterator[Group]:
+        """(probability, size, pairs, tier) groups in the order they will be probed."""
+        return self._groups(self._prepare(spec, ports))
+
+    def _prepare(self, spec, ports: List[int]) -> Dict:
+        model = HitModel(self.store.known_open())
+        ports = list(dict.fromkeys(ports))
+        port_set = set(ports)
+        # Ports without subnet-specific history rank by fleet rate alone, and
+        # most of them tie at the rate of an unranked port never seen open
+        ranked = {port for port in (*PORT_RANK, *model.open_by_port) if port in port_set}
+        order = heapq.merge(
+            sorted(ranked, key=lambda port: -model.fleet_rate(port)),
+            (port for port in ports if port not in ranked),
+            key=lambda port: -model.fleet_rate(port)
+        )
+        known = {ip: open_ports for ip, open_ports in model.known.items() if ip in spec}
+        return {
+            'model': model,
+            'ports': ports,
+            'port_set': port_set,
+            'order': list(order),
+            'known': known,
+            'known_pairs': [(ip, port) for ip, open_ports in known.items()
+                            for port in open_ports if port in port_set],
+            'subnets': self._subnet_sizes(spec),
+            'spec': spec
+        }
+
+    @staticmethod
+    def _ranked_ports(plan: Dict, subnet: int, skip=()) -> Iterator[Tuple[float, int]]:
+        """(port rate, port) for the plan's ports in one /24, highest rate first."""
+        model = plan['model']
+        boosted = {port for port in model.ports_by_subnet.get(subnet, ())
+                   if port in plan['port_set'] and port not in skip}
+        return heapq.merge(
+            sorted(((model.port_rate(subnet, port), port) for port in boosted), key=_by_probability),
+            ((model.port_rate(subnet, port), port) for port in plan['order']
+             if port not in boosted and port not in skip),
+            key=_by_probability
+        )
+
+    def _groups(self, plan: Dict) -> Iterator[Group]:
+        model, known, known_pairs = plan['model'], plan['known'], plan['known_pairs']
+        if known_pairs:
+            yield KNOWN_OPEN_PRIOR, len(known_pairs), lambda: iter(known_pairs), KNOWN_OPEN
+
+        def host_groups(ip, open_ports):
+            for rate, port in self._ranked_ports(plan, _subnet(ip), set(open_ports)):
+                yield rate, 1, lambda ip=ip, port=port: iter([(ip, port)]), KNOWN_LIVE
+
+        yield from heapq.merge(*(host_groups(ip, open_ports) for ip, open_ports in known.items()),
+                               key=_by_probability)
+
+        known_by_subnet = Counter(_subnet(ip) for ip in known)
+
+        def subnet_groups(subnet, size):
+            live = model.live_rate(subnet)
+            for rate, port in self._ranked_ports(plan, subnet):
+                yield live * rate, size, lambda port=port: (
+                    (ip, port) for ip in self._unknown_hosts(plan['spec'], subnet, known)
+                ), UNKNOWN
+
+        yield from heapq.merge(*(
+            subnet_groups(subnet, size - known_by_subnet[subnet])
+            for subnet, size in plan['subnets'].items() if size > known_by_subnet[subnet]
+        ), key=_by_probability)
+
+    @staticmethod
+    def _totals(plan: Dict) -> Tuple[int, float]:
+        """Probe count and summed hit probability of the whole plan, without walking it."""
+        model, ports = plan['model'], plan['ports']
+        fleet_sum = sum(model.fleet_rate(port) for port in ports)
+        subnet_open = Counter()
+        for (subnet, port), count in model.open_by_subnet.items():
+            if port in plan['port_set']:
+                subnet_open[subnet] += count
+
+        def rate_sum(subnet, skip=()):
+            return (subnet_open[subnet] - sum(model.open_by_subnet[(subnet, port)] for port in skip)
+                    + 2 * (fleet_sum - sum(model.fleet_rate(port) for port in skip))) \
+                / (model.live_by_subnet[subnet] + 2)
+
+        total = len(plan['known_pairs'])
+        weight = KNOWN_OPEN_PRIOR * total
+        known_by_subnet = Counter()
+        for ip, open_ports in plan['known'].items():
+            subnet = _subnet(ip)
+            known_by_subnet[subnet] += 1
+            skip = set(open_ports) & plan['port_set']
+            total += len(ports) - len(skip)
+            weight += rate_sum(subnet, skip)
+        for subnet, size in plan['subnets'].items():
+            size -= known_by_subnet[subnet]
+            if size > 0:
+                total += size * len(ports)
+                weight += model.live_rate(subnet) * size * rate_sum(subnet)
+        return total, weight
+
+    @staticmethod
+    def _subnet_sizes(spec) -> Dict[int, int]:
+        """Number of spec addresses in each /24 it touches, from interval bounds only."""
+        sizes = Counter()
+        for intervals, sign in ((spec.include, 1), (spec.exclude, -1)):
+            for start, end in intervals:
+                for subnet in range(start >> 8, (end >> 8) + 1):
+                    low, high = max(start, subnet << 8), min(end, (subnet << 8) + 255)
+                    if sign > 0:
+                        sizes[subnet] += high - low + 1
+                    elif subnet in sizes:
+                        # Only the part of the exclusion that overlaps an included range
+                        sizes[subnet] -= sum(
+                            max(0, min(high, inc_end) - max(low, inc_start) + 1)
+                            for inc_start, inc_end in spec.include
+                        )
+        return {subnet: size for subnet, size in sizes.items() if size > 0}
+
+    @staticmethod
+    def _unknown_hosts(spec, subnet: int, known: Dict) -> Iterator[str]:
+        for address in range(subnet << 8, (subnet + 1) << 8):
+            ip = str(ipaddress.IPv4Address(address))
+            if ip not in known and ip in spec:
+                yield ip
+
+    def run(self, spec, ports: List[int], budget: float) -> Dict:
+        """Scan for at most `budget` seconds; returns {'network': [...], 'coverage': {...}}."""
+        started = time.monotonic()
+        plan = self._prepare(spec, ports)
+        groups = self._groups(plan)
+        table = HostPortTable(ports)
+        weights: Dict[Tuple[str, int], float] = {}
+        states = Counter()
+        progress = {'probed_weight': 0.0, 'known_verified': 0}
+
+        def pairs() -> Iterable[Tuple[str, int]]:
+            for probability, _, members, tier in groups:
+                for pair in members():
+                    weights[pair] = (probability, tier == KNOWN_OPEN)
+                    yield pair
+
+        async def consume():
+            async for ip, port, state in self.engine.pair_stream(pairs()):
+                probability, is_known = weights.pop((ip, port))
+                progress['probed_weight'] += probability
+                states[state] += 1
+                if state == OPEN:
+                    table.add(ip, [port])
+                    progress['known_verified'] += is_known
+
+        loop = asyncio.new_event_loop()
+        deadline_hit = False
+        try:
+            remaining = max(0.0, budget - (time.monotonic() - started))
+            loop.run_until_complete(asyncio.wait_for(consume(), remaining))
+        except asyncio.TimeoutError:
+            deadline_hit = True
+        finally:
+            # Closes the probe stream, which cancels probes still in flight
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+        for ip, open_ports in table:
+            self.store.record_host(ip, open_ports, open_ports)
+
+        total, total_weight = self._totals(plan)
+        probed = sum(states.values())
+        known_total = len(plan['known_pairs'])
+        return {
+            'network': list(table.records()),
+            'coverage': {
+                'deadline_hit': deadline_hit,
+                'budget': budget,
+                'elapsed': round(time.monotonic() - started, 3),
+                'probes_total': total,
+                'probes_done': probed,
+                'probe_coverage': round(probed / total, 4) if total else 1.0,
+                # Share of the open services we expected to exist that were probed
+                'expected_open_coverage': round(progress['probed_weight'] / total_weight, 4)
+                if total_weight else 1.0,
+                'known_services': {'total': known_total,
+                                   'still_open': progress['known_verified']},
+                'open': states[OPEN],
+                'closed': states[CLOSED],
+                'filtered': states[FILTERED],
+                'errors': states[ERROR]
+            }
+        }
@@ -0,0 +1,119 @@
+import socket
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from threading import Lock
+from typing import Dict, Iterable, Iterator, Optional
+from scan_engine import HostRecord, iter_pipelined
+from scan_metrics import METRICS
+
+UNKNOWN_HOSTNAME = "Unknown"
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries expire after a per-entry TTL."""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if time.monotonic() >= expires:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class ReverseResolver:
+    """Concurrent, cached PTR lookups that stay off the scan path.
+
+    Lookups run on a small thread pool because gethostbyaddr() blocks and
+    has no timeout of its own. Misses are cached too (for a shorter time)
+    so networks without PTR records don't pay the resolver timeout twice.
+    """
+
+    def __init__(self, max_workers: int = 32, timeout: float = 2.0,
+                 ttl: float = 3600, negative_ttl: float = 300, maxsize: int = 4096):
+        self.timeout = timeout
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(maxsize)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='rdns')
+        self._inflight: Dict[str, Future] = {}
+        self._lock = Lock()
+
+    def _lookup_uncached(self, ip: str) -> str:
+        started = time.monotonic()
+        try:
+            hostname = socket.gethostbyaddr(ip)[0]
+            self.cache.set(ip, hostname, self.ttl)
+        except (OSError, UnicodeError):
+            hostname = UNKNOWN_HOSTNAME
+            self.cache.set(ip, hostname, self.negative_ttl)
+        METRICS.dns_lookup(time.monotonic() - started)
+        with self._lock:
+            self._inflight.pop(ip, None)
+        return hostname
+
+    def submit(self, ip: str) -> Future:
+        """Start (or join) a lookup for ip; cache hits return a finished future."""
+        cached = self.cache.get(ip)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+        with self._lock:
+            future = self._inflight.get(ip)
+            if future is None:
+                future = self._executor.submit(self._lookup_uncached, ip)
+                self._inflight[ip] = future
+            return future
+
+    def _result(self, future: Future, timeout: Optional[float] = None) -> str:
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # Keep the lookup running; its answer lands in the cache for next time
+            return UNKNOWN_HOSTNAME
+
+    def lookup(self, ip: str) -> str:
+        """Blocking lookup bounded by the resolver timeout."""
+        return self._result(self.submit(ip), self.timeout)
+
+    def resolve_many(self, ips: Iterable[str]) -> Dict[str, str]:
+        """Resolve a batch of addresses concurrently."""
+        futures = [(ip, self.submit(ip)) for ip in ips]
+        deadline = time.monotonic() + self.timeout
+        return {
+            ip: self._result(future, max(0.0, deadline - time.monotonic()))
+            for ip, future in futures
+        }
+
+    def iter_resolved(self, results: Iterable[HostRecord]) -> Iterator[HostRecord]:
+        """Fill in record['hostname'] for a stream of scan results.
+
+        Only live hosts are looked up. Lookups overlap with the scan that
+        produces results, and items come out in input order once their
+        lookup has finished or timed out.
+        """
+        return iter_pipelined(results, lambda item: self.submit(item[0]),
+                              self._apply, self.timeout)
+
+    def _apply(self, record: Dict, future: Future, time_left: float):
+        record['hostname'] = self._result(future, time_left)
@@ -0,0 +1,100 @@
+import socket
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from scan_resolver import UNKNOWN_HOSTNAME
+
+class HostPortTable:
+    """Scan results keyed by host, with open ports packed into a bitmask.
+
+    Bit i of a host's mask stands for self.ports[i], the i-th distinct port
+    seen, so a host costs one int however many ports are open. Hostnames
+    service and TLS details are kept separately, only for hosts that have them.
+    """
+
+    def __init__(self, ports: Optional[Iterable[int]] = None):
+        self.ports: List[int] = []
+        self._bits: Dict[int, int] = {}
+        self._masks: Dict[int, int] = {}
+        self._details: Dict[int, Tuple[str, Optional[List[Dict]], Optional[List[Dict]]]] = {}
+        for port in ports or ():
+            self._bit(port)
+
+    def _bit(self, port: int) -> int:
+        bit = self._bits.get(port)
+        if bit is None:
+            bit = self._bits[port] = 1 << len(self.ports)
+            self.ports.append(port)
+        return bit
+
+    @staticmethod
+    def _key(ip: str) -> int:
+        return int.from_bytes(socket.inet_aton(ip), 'big')
+
+    def add(self, ip: str, open_ports: Iterable[int], hostname: Optional[str] = None,
+            services: Optional[List[Dict]] = None, tls: Optional[List[Dict]] = None):
+        mask = 0
+        for port in open_ports:
+            mask |= self._bit(port)
+        if not mask:
+            return
+        key = self._key(ip)
+        self._masks[key] = self._masks.get(key, 0) | mask
+        self.annotate(ip, hostname, services, tls)
+
+    def annotate(self, ip: str, hostname: Optional[str] = None,
+                 services: Optional[List[Dict]] = None, tls: Optional[List[Dict]] = None):
+        """Attach a hostname, service or TLS details to a host already in the table."""
+        key = self._key(ip)
+        if key not in self._masks:
+            return
+        old_hostname, old_services, old_tls = self._details.get(key, (UNKNOWN_HOSTNAME, None, None))
+        if hostname in (None, UNKNOWN_HOSTNAME):
+            hostname = old_hostname
+        if services is None:
+            services = old_services
+        if tls is None:
+            tls = old_tls
+        if hostname != UNKNOWN_HOSTNAME or services is not None or tls is not None:
+            self._details[key] = (hostname, services, tls)
+
+    def add_record(self, record: Dict):
+        """Fold in a host record as produced by the scan pipeline."""
+        self.add(record['ip'], record['ports'], record.get('hostname'),
+                 record.get('services'), record.get('tls'))
+
+    def open_ports(self, ip: str) -> List[int]:
+        return self._decode(self._masks.get(self._key(ip), 0))
+
+    def _decode(self, mask: int) -> List[int]:
+        ports = []
+        while mask:
+            low = mask & -mask
+            ports.append(self.ports[low.bit_length() - 1])
+            mask ^= low
+        return sorted(ports)
+
+    def __len__(self) -> int:
+        return len(self._masks)
+
+    def __contains__(self, ip: str) -> bool:
+        return self._key(ip) in self._masks
+
+    def __iter__(self) -> Iterator[Tuple[str, List[int]]]:
+        for key in sorted(self._masks):
+            yield socket.inet_ntoa(key.to_bytes(4, 'big')), self._decode(self._masks[key])
+
+    def records(self) -> Iterator[Dict]:
+        """One API record per host, in address order."""
+        for key in sorted(self._masks):
+            hostname, services, tls = self._details.get(key, (UNKNOWN_HOSTNAME, None, None))
+            record = {
+                'ip': socket.inet_ntoa(key.to_bytes(4, 'big')),
+                'hostname': hostname,
+                'status': 'up',
+                'ports': self._decode(self._masks[key])
+            }
+            if services is not None:
+                record['services'] = services
+            if tls is not None:
+                record['tls'] = tls
+            yield record
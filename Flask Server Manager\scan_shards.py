@@ -0,0 +1,120 @@
+import heapq
+import multiprocessing
+import os
+import queue as queue_module
+import socket
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+from scan_engine import AsyncScanEngine, HostResult
+from scan_timing import AdaptiveTimeouts
+from scan_pacing import PacingPolicy
+
+BATCH_SIZE = 64
+# How often a reader waiting on a silent shard checks that its worker is alive
+POLL_INTERVAL = 1.0
+# Workers start from a fresh interpreter: forking a threaded (and possibly
+# gevent-patched) web worker would copy held locks and open sqlite handles
+START_METHOD = 'spawn'
+
+def _ordered(results: Iterator[HostResult], issued: deque) -> Iterator[HostResult]:
+    """Re-emit engine results in the order their hosts were issued."""
+    done: Dict[str, List[int]] = {}
+    for ip, open_ports in results:
+        done[ip] = open_ports
+        while issued and issued[0] in done:
+            head = issued.popleft()
+            yield head, done.pop(head)
+
+def _scan_shard(spec, index: int, count: int, ports: List[int],
+                engine_options: Dict, queue):
+    """Worker process: scan every count-th address of spec, starting at index."""
+    try:
+        engine = AsyncScanEngine(timeouts=AdaptiveTimeouts(), **engine_options)
+        issued = deque()
+
+        def hosts():
+            for ip in spec.iter_shard(index, count):
+                issued.append(ip)
+                yield ip
+
+        batch = []
+        for result in _ordered(engine.iter_scan(hosts(), ports), issued):
+            batch.append(result)
+            if len(batch) >= BATCH_SIZE:
+                queue.put(batch)
+                batch = []
+        if batch:
+            queue.put(batch)
+        queue.put(None)
+    except Exception as e:
+        queue.put(f"shard {index}: {e}")
+
+class ShardedScanner:
+    """Spreads a scan over worker processes, each running its own AsyncScanEngine.
+
+    Shard i takes every n-th address starting at i, so all shards advance
+    through the address space at the same pace. Each worker emits its
+    results in address order, which lets the parent merge the shard
+    streams into one ordered stream while buffering only a few batches.
+    """
+
+    def __init__(self, processes: Optional[int] = None, concurrency: int = 512,
+                 timeout: float = 0.5, discovery: bool = False,
+                 pacing: Optional[PacingPolicy] = None):
+        self.processes = processes or os.cpu_count() or 1
+        self.engine_options = {
+            'concurrency': max(1, concurrency // self.processes),
+            'timeout': timeout,
+            'discovery': discovery,
+            # Each worker paces independently with its share of the global rate
+            'pacing': pacing.split(self.processes) if pacing else None
+        }
+
+    def _read_shard(self, process, queue) -> Iterator[HostResult]:
+        while True:
+            try:
+                batch = queue.get(timeout=POLL_INTERVAL)
+            except queue_module.Empty:
+                if process.is_alive():
+                    continue
+                # Killed workers (OOM, SIGKILL, segfault) never send the None
+                # sentinel; take anything flushed just before exit, then fail
+                try:
+                    batch = queue.get(timeout=POLL_INTERVAL)
+                except queue_module.Empty:
+                    raise RuntimeError(
+                        f"Scan worker exited with code {process.exitcode}"
+                    ) from None
+            if batch is None:
+                return
+            if isinstance(batch, str):
+                raise RuntimeError(f"Scan worker failed: {batch}")
+            yield from batch
+
+    def iter_scan(self, spec, ports: List[int]) -> Iterator[HostResult]:
+        """Yield (ip, open_ports) for every host in spec, in address order."""
+        ctx = multiprocessing.get_context(START_METHOD)
+        workers = []
+        try:
+            for index in range(self.processes):
+                # Bounded queues give backpressure if the consumer is slow
+                queue = ctx.Queue(maxsize=16)
+                process = ctx.Process(
+                    target=_scan_shard,
+                    args=(spec, index, self.processes, ports, self.engine_options, queue),
+                    daemon=True
+                )
+                process.start()
+                workers.append((process, queue))
+
+            yield from heapq.merge(
+                *(self._read_shard(process, queue) for process, queue in workers),
+                key=lambda result: socket.inet_aton(result[0])
+            )
+        finally:
+            for process, queue in workers:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+                queue.close()
@@ -0,0 +1,134 @@
+import itertools
+import sqlite3
+import time
+from collections import defaultdict
+from threading import Lock
+from typing import Dict, Iterable, List, Optional
+
+class ScanStateStore:
+    """SQLite record of which host:port pairs were open and when they were last seen."""
+
+    def __init__(self, path: str = 'scan_state.db'):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        with self._lock, self._conn:
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS services (
+                    ip TEXT NOT NULL,
+                    port INTEGER NOT NULL,
+                    is_open INTEGER NOT NULL,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL,
+                    last_checked REAL NOT NULL,
+                    PRIMARY KEY (ip, port)
+                );
+                CREATE TABLE IF NOT EXISTS sweep_cursors (
+                    spec TEXT PRIMARY KEY,
+                    position INTEGER NOT NULL,
+                    updated REAL NOT NULL
+                );
+            ''')
+
+    def record_host(self, ip: str, probed_ports: Iterable[int], open_ports: Iterable[int],
+                    timestamp: Optional[float] = None):
+        """Store the outcome of probing probed_ports on ip."""
+        timestamp = timestamp or time.time()
+        open_ports = set(open_ports)
+        closed = [port for port in probed_ports if port not in open_ports]
+        with self._lock, self._conn:
+            self._conn.executemany('''
+                INSERT INTO services (ip, port, is_open, first_seen, last_seen, last_checked)
+                VALUES (?, ?, 1, ?, ?, ?)
+                ON CONFLICT (ip, port) DO UPDATE SET
+                    is_open = 1, last_seen = excluded.last_seen,
+                    last_checked = excluded.last_checked,
+                    first_seen = CASE WHEN services.is_open THEN services.first_seen
+                                      ELSE excluded.first_seen END
+            ''', [(ip, port, timestamp, timestamp, timestamp) for port in open_ports])
+            self._conn.executemany('''
+                UPDATE services SET is_open = 0, last_checked = ?
+                WHERE ip = ? AND port = ?
+            ''', [(timestamp, ip, port) for port in closed])
+
+    def known_open(self, spec=None) -> Dict[str, List[int]]:
+        """Currently-open ports per host, optionally restricted to a TargetSpec."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT ip, port FROM services WHERE is_open = 1 ORDER BY ip, port'
+            ).fetchall()
+        known = defaultdict(list)
+        for ip, port in rows:
+            if spec is None or ip in spec:
+                known[ip].append(port)
+        return dict(known)
+
+    def last_seen(self, ip: str) -> Dict[int, float]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT port, last_seen FROM services WHERE ip = ? AND is_open = 1', (ip,)
+            ).fetchall()
+        return dict(rows)
+
+    def next_sweep_slice(self, spec, key: str, budget: int) -> List[str]:
+        """Next `budget` addresses of spec, continuing where the last call stopped.
+
+        The position wraps around, so repeated incremental scans cover the
+        whole target space a slice at a time.
+        """
+        total = len(spec)
+        if total == 0 or budget <= 0:
+            return []
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT position FROM sweep_cursors WHERE spec = ?', (key,)
+            ).fetchone()
+        position = row[0] % total if row else 0
+        hosts = list(itertools.islice(iter(spec), position, position + budget))
+        if len(hosts) < budget:
+            hosts += list(itertools.islice(iter(spec), min(budget - len(hosts), position)))
+        with self._lock, self._conn:
+            self._conn.execute('''
+                INSERT INTO sweep_cursors (spec, position, updated) VALUES (?, ?, ?)
+                ON CONFLICT (spec) DO UPDATE SET
+                    position = excluded.position, updated = excluded.updated
+            ''', (key, (position + len(hosts)) % total, time.time()))
+        return hosts
+
+class IncrementalScanner:
+    """Refresh known services cheaply and sample the unknown space.
+
+    Known-open host:port pairs are re-verified first, exactly. Then up to
+    sweep_budget further hosts are swept in full, rotating through the
+    target space across runs. The result is a diff against the stored
+    state rather than a full listing.
+    """
+
+    def __init__(self, engine, store: ScanStateStore):
+        self.engine = engine
+        self.store = store
+
+    def run(self, spec, ports: List[int], sweep_budget: int = 256,
+            spec_key: Optional[str] = None) -> Dict:
+        known = self.store.known_open(spec)
+        diff = {'new': [], 'gone': [], 'unchanged': []}
+        now = time.time()
+
+        for ip, open_ports in self.engine.iter_verify(known.items()):
+            for port in known[ip]:
+                bucket = 'unchanged' if port in open_ports else 'gone'
+                diff[bucket].append({'ip': ip, 'port': port})
+            self.store.record_host(ip, known[ip], open_ports, now)
+
+        sweep = self.store.next_sweep_slice(spec, spec_key or repr(spec.include), sweep_budget)
+        for ip, open_ports in self.engine.iter_scan(sweep, ports):
+            # Pairs already verified above are not re-reported
+            for port in open_ports:
+                if port not in known.get(ip, ()):
+                    diff['new'].append({'ip': ip, 'port': port})
+            self.store.record_host(ip, [p for p in ports if p not in known.get(ip, ())],
+                                   open_ports, now)
+
+        diff['swept'] = len(sweep)
+        diff['verified'] = sum(len(ports) for ports in known.values())
+        return diff
@@ -0,0 +1,152 @@
+import ipaddress
+import itertools
+from bisect import bisect_right
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+Interval = Tuple[int, int]
+
+# TCP ports ranked by how often they turn up open on internal networks,
+# most likely first; port-range scans probe these before the rest
+PORT_LIKELIHOOD = [
+    80, 443, 22, 21, 23, 25, 3389, 110, 445, 139, 143, 53, 135, 3306, 8080,
+    1723, 111, 995, 993, 5900, 1025, 587, 8888, 199, 1720, 465, 548, 113, 81,
+    6001, 10000, 514, 5060, 179, 1026, 2000, 8443, 8000, 32768, 554, 26, 1433,
+    49152, 2001, 515, 8008, 49154, 1027, 5666, 646, 5000, 5631, 631, 49153,
+    8081, 2049, 88, 79, 5800, 106, 2121, 1110, 49155, 6000, 513, 990, 5357,
+    427, 49156, 543, 544, 5101, 144, 7, 389, 5432, 6379, 27017, 9200, 11211,
+    5672, 9090, 3000, 5601, 2375, 2376, 6443, 9000, 9100, 8086, 8089, 5985,
+    5986, 1521, 1883, 8883, 2181, 9092, 15672, 9300, 4443, 7001, 8009, 8180,
+    3128, 1080, 873, 636, 3268, 9418, 5984, 50000, 161, 162, 69, 123,
+]
+
+def _parse_interval(token: str) -> Interval:
+    """Parse a CIDR, an a-b range or a single address into an inclusive int interval."""
+    token = token.strip()
+    if '/' in token:
+        network = ipaddress.IPv4Network(token, strict=False)
+        start, end = int(network.network_address), int(network.broadcast_address)
+        # Skip network and broadcast addresses, like ip_network.hosts()
+        if network.num_addresses > 2:
+            start, end = start + 1, end - 1
+        return start, end
+    if '-' in token:
+        first, last = (part.strip() for part in token.split('-', 1))
+        start = ipaddress.IPv4Address(first)
+        if '.' not in last:
+            # Last-octet shorthand: 10.0.0.1-50
+            last = first.rsplit('.', 1)[0] + '.' + last
+        end = ipaddress.IPv4Address(last)
+        if end < start:
+            raise ValueError(f"Invalid range: {token}")
+        return int(start), int(end)
+    address = int(ipaddress.IPv4Address(token))
+    return address, address
+
+def _merge(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sort and coalesce overlapping or adjacent intervals."""
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _split(value) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.replace(',', ' ').split()
+    return [token for token in value if token]
+
+class TargetSpec:
+    """Set of IPv4 scan targets built from CIDRs, ranges and exclusions.
+
+    Only interval bounds are stored, so a /16 costs a few integers and
+    addresses are produced lazily on iteration.
+    """
+
+    def __init__(self, include: Iterable[str], exclude: Optional[Iterable[str]] = None):
+        self.include = _merge(_parse_interval(token) for token in _split(include))
+        self.exclude = _merge(_parse_interval(token) for token in _split(exclude))
+        self._exclude_starts = [start for start, _ in self.exclude]
+
+    @classmethod
+    def parse(cls, spec: str, exclude: Optional[str] = None) -> 'TargetSpec':
+        """Parse "10.0.0.0/22, 10.1.0.1-50, !10.0.1.0/24" style specs."""
+        include, excluded = [], _split(exclude)
+        for token in _split(spec):
+            if token.startswith('!'):
+                excluded.append(token[1:])
+            else:
+                include.append(token)
+        return cls(include, excluded)
+
+    def _excluded_end(self, address: int) -> Optional[int]:
+        """End of the exclusion interval covering address, if any."""
+        index = bisect_right(self._exclude_starts, address) - 1
+        if index >= 0 and self.exclude[index][1] >= address:
+            return self.exclude[index][1]
+        return None
+
+    def __contains__(self, ip) -> bool:
+        address = int(ipaddress.IPv4Address(ip))
+        if self._excluded_end(address) is not None:
+            return False
+        return any(start <= address <= end for start, end in self.include)
+
+    def __iter__(self) -> Iterator[str]:
+        for start, end in self.include:
+            address = start
+            while address <= end:
+                skip_to = self._excluded_end(address)
+                if skip_to is not None:
+                    address = skip_to + 1
+                    continue
+                yield str(ipaddress.IPv4Address(address))
+                address += 1
+
+    def iter_shard(self, index: int, count: int) -> Iterator[str]:
+        """Every count-th address, starting with the index-th."""
+        return itertools.islice(iter(self), index, None, count)
+
+    def __len__(self) -> int:
+        total = 0
+        for start, end in self.include:
+            total += end - start + 1
+            for ex_start, ex_end in self.exclude:
+                overlap = min(end, ex_end) - max(start, ex_start) + 1
+                if overlap > 0:
+                    total -= overlap
+        return total
+
+def parse_ports(spec: str) -> List[int]:
+    """Parse "22,80,8000-8100", "top:100" or "all" into a likelihood-ordered port list."""
+    spec = (spec or '').strip().lower()
+    if spec in ('all', '-'):
+        spec = '1-65535'
+    if spec.startswith('top:'):
+        count = int(spec[4:])
+        if count < 1:
+            raise ValueError(f"Invalid port count: {spec[4:]}")
+        if count <= len(PORT_LIKELIHOOD):
+            return PORT_LIKELIHOOD[:count]
+        spec = '1-65535'
+        limit = count
+    else:
+        limit = None
+
+    ports = set()
+    for token in spec.replace(',', ' ').split():
+        first, _, last = token.partition('-')
+        start, end = int(first), int(last or first)
+        if not 1 <= start <= end <= 65535:
+            raise ValueError(f"Invalid port range: {token}")
+        ports.update(range(start, end + 1))
+    if not ports:
+        raise ValueError("No ports given")
+
+    ordered = [port for port in PORT_LIKELIHOOD if port in ports]
+    ranked = set(ordered)
+    ordered += sorted(port for port in ports if port not in ranked)
+    return ordered[:limit] if limit else ordered
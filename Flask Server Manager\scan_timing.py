@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional
+
+class RttEstimator:
+    """Smoothed RTT and variance, updated like TCP's SRTT/RTTVAR (RFC 6298)."""
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+
+    def __init__(self):
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+        self.samples = 0
+
+    def update(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.samples += 1
+
+    @property
+    def rto(self) -> Optional[float]:
+        if self.srtt is None:
+            return None
+        return self.srtt + 4 * self.rttvar
+
+class AdaptiveTimeouts:
+    """Per-host probe timeouts learned from measured connect RTTs.
+
+    Any probe that gets an answer (connect or refusal) is an RTT sample for
+    its host and its /24. A host with no samples yet borrows its subnet's
+    estimate, and a subnet with none uses initial_timeout. Results are
+    clamped to [min_timeout, max_timeout] so a single fast LAN answer can't
+    starve slower hosts and a VPN hop can't stall the scan. Estimates are
+    kept for the max_hosts/max_subnets most recently probed, so a
+    long-lived instance doesn't grow with every address ever scanned.
+    """
+
+    def __init__(self, initial_timeout: float = 1.0, min_timeout: float = 0.1,
+                 max_timeout: float = 3.0, max_hosts: int = 65536,
+                 max_subnets: int = 4096):
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.max_hosts = max_hosts
+        self.max_subnets = max_subnets
+        self._hosts: OrderedDict = OrderedDict()
+        self._subnets: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def subnet_of(ip: str) -> str:
+        return ip.rsplit('.', 1)[0]
+
+    def observe(self, ip: str, rtt: float):
+        """Record the RTT of a probe that got an answer."""
+        with self._lock:
+            self._estimator(self._hosts, ip, self.max_hosts).update(rtt)
+            self._estimator(self._subnets, self.subnet_of(ip), self.max_subnets).update(rtt)
+
+    @staticmethod
+    def _estimator(estimators: OrderedDict, key: str, maxsize: int) -> RttEstimator:
+        """The estimator for key, created if needed; least recently used ones go first."""
+        estimator = estimators.get(key)
+        if estimator is None:
+            estimator = estimators[key] = RttEstimator()
+            while len(estimators) > maxsize:
+                estimators.popitem(last=False)
+        else:
+            estimators.move_to_end(key)
+        return estimator
+
+    def timeout(self, ip: str) -> float:
+        """Timeout to use for the next probe to ip."""
+        with self._lock:
+            for estimator in (self._hosts.get(ip), self._subnets.get(self.subnet_of(ip))):
+                if estimator is not None and estimator.rto is not None:
+                    return min(self.max_timeout, max(self.min_timeout, estimator.rto))
+        return self.initial_timeout
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Current per-subnet estimates, for diagnostics."""
+        with self._lock:
+            return {
+                subnet: {'srtt': est.srtt, 'rttvar': est.rttvar, 'samples': est.samples}
+                for subnet, est in self._subnets.items()
+            }
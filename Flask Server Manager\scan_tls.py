@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import ssl
+import threading
+from concurrent.futures import Future, TimeoutError
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from scan_engine import HostRecord, iter_pipelined
+from scan_resolver import TTLCache
+
+# Ports that speak TLS from the first byte (not STARTTLS)
+TLS_PORTS = {443, 465, 636, 853, 990, 993, 995, 5986, 6443, 8443, 9443}
+
+NAME_ATTRIBUTES = {
+    NameOID.COMMON_NAME: 'commonName',
+    NameOID.COUNTRY_NAME: 'countryName',
+    NameOID.LOCALITY_NAME: 'localityName',
+    NameOID.STATE_OR_PROVINCE_NAME: 'stateOrProvinceName',
+    NameOID.ORGANIZATION_NAME: 'organizationName',
+    NameOID.ORGANIZATIONAL_UNIT_NAME: 'organizationalUnitName',
+}
+
+def _name(name: x509.Name) -> Dict[str, str]:
+    return {NAME_ATTRIBUTES[attribute.oid]: str(attribute.value)
+            for attribute in name if attribute.oid in NAME_ATTRIBUTES}
+
+def _utc(cert: x509.Certificate, field: str) -> datetime:
+    # cryptography < 42 only has the naive-UTC attributes
+    value = getattr(cert, field + '_utc', None)
+    return value if value is not None else getattr(cert, field).replace(tzinfo=timezone.utc)
+
+def _alt_names(cert: x509.Certificate) -> List[str]:
+    try:
+        names = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+    except x509.ExtensionNotFound:
+        return []
+    return names.get_values_for_type(x509.DNSName) + \
+        [str(address) for address in names.get_values_for_type(x509.IPAddress)]
+
+def parse_certificate(der: bytes) -> Dict:
+    """Subject, issuer, SANs and validity from a DER X.509 certificate."""
+    cert = x509.load_der_x509_certificate(der)
+    return {
+        'serial': format(cert.serial_number, 'x'),
+        'issuer': _name(cert.issuer),
+        'subject': _name(cert.subject),
+        'alt_names': _alt_names(cert),
+        'not_before': _utc(cert, 'not_valid_before').isoformat(),
+        'not_after': _utc(cert, 'not_valid_after').isoformat(),
+    }
+
+class TlsInspector:
+    """Pulls certificates off TLS ports alongside the scan.
+
+    Handshakes run on a dedicated event loop thread, at most `concurrency`
+    at a time and each bounded by `timeout`. Certificates are not verified,
+    only read. Parsed certificates are cached by (ip, port, sha256), so a
+    cert that hasn't changed since the last scan is not parsed again.
+    Expiry reports come from the asset inventory, which stores what lands
+    in record['tls'].
+    """
+
+    def __init__(self, concurrency: int = 32, timeout: float = 3.0,
+                 ports: Optional[Iterable[int]] = None, ttl: float = 86400, maxsize: int = 4096):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ports = set(TLS_PORTS if ports is None else ports)
+        self.ttl = ttl
+        self.cache = TTLCache(maxsize)
+        self.parsed = 0
+        self._context = ssl.create_default_context()
+        self._context.check_hostname = False
+        self._context.verify_mode = ssl.CERT_NONE
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='tls-inspector',
+                                 daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    async def _handshake(self, ip: str, port: int) -> Tuple[bytes, str]:
+        reader, writer = await asyncio.open_connection(ip, port, ssl=self._context)
+        try:
+            ssl_object = writer.get_extra_info('ssl_object')
+            return ssl_object.getpeercert(binary_form=True), ssl_object.version()
+        finally:
+            writer.close()
+
+    async def inspect(self, ip: str, port: int) -> Optional[Dict]:
+        """Certificate details for one port, or None if no handshake completed in time."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            try:
+                der, version = await asyncio.wait_for(self._handshake(ip, port), self.timeout)
+            except (OSError, ssl.SSLError, asyncio.TimeoutError):
+                return None
+        if not der:
+            return None
+        fingerprint = hashlib.sha256(der).hexdigest()
+        key = (ip, port, fingerprint)
+        cert = self.cache.get(key)
+        if cert is None:
+            try:
+                cert = parse_certificate(der)
+            except ValueError:
+                cert = {}
+            cert['fingerprint'] = fingerprint
+            self.cache.set(key, cert, self.ttl)
+            self.parsed += 1
+        info = dict(cert, ip=ip, port=port, tls_version=version)
+        if 'not_after' in cert:
+            expires = datetime.fromisoformat(cert['not_after'])
+            info['expires_in_days'] = (expires - datetime.now(timezone.utc)).days
+        return info
+
+    async def inspect_host(self, ip: str, ports: List[int]) -> List[Dict]:
+        results = await asyncio.gather(*(self.inspect(ip, port) for port in ports))
+        return [info for info in results if info]
+
+    def submit(self, ip: str, ports: List[int]) -> Optional[Future]:
+        tls_ports = [port for port in ports if port in self.ports]
+        if not tls_ports:
+            return None
+        return asyncio.run_coroutine_threadsafe(self.inspect_host(ip, tls_ports),
+                                                self._ensure_loop())
+
+    def iter_inspected(self, results: Iterable[HostRecord]) -> Iterator[HostRecord]:
+        """Fill in record['tls'] for hosts with an open TLS port as the scan streams by."""
+        return iter_pipelined(results, lambda item: self.submit(item[0], item[1]),
+                              self._apply, self.timeout * 2)
+
+    def _apply(self, record: Dict, future: Future, time_left: float):
+        try:
+            record['tls'] = future.result(timeout=time_left)
+        except TimeoutError:
+            future.cancel()
+            record['tls'] = []
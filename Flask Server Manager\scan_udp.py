@@ -0,0 +1,332 @@
+import errno
+import heapq
+import itertools
+import selectors
+import socket
+import struct
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from scan_engine import HostRecord, OPEN, CLOSED, FILTERED, CANCELLED, UNREACHABLE_ERRNOS
+from scan_resolver import UNKNOWN_HOSTNAME
+from scan_metrics import METRICS
+
+# No reply and no ICMP error: either listening quietly or dropped by a firewall
+OPEN_FILTERED = 'open|filtered'
+
+# Linux only reports ICMP errors for unconnected UDP sockets with IP_RECVERR
+IP_RECVERR = getattr(socket, 'IP_RECVERR', 11 if sys.platform.startswith('linux') else None)
+
+@dataclass
+class UdpProbe:
+    """Payload for one UDP service.
+
+    build(probe_id) makes the datagram; parse(reply) returns (probe_id,
+    banner) for a valid reply, or None. parse is None for protocols that
+    never answer (syslog). id_bits is the width of the ID field the
+    protocol echoes back, 0 if it has none.
+    """
+    service: str
+    id_bits: int
+    build: Callable[[Optional[int]], bytes]
+    parse: Optional[Callable[[bytes], Optional[Tuple[Optional[int], str]]]]
+
+DNS_RCODES = {0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMP', 5: 'REFUSED'}
+
+def _dns_query(probe_id: int) -> bytes:
+    # Root NS query, recursion desired
+    return struct.pack('>HHHHHH', probe_id, 0x0100, 1, 0, 0, 0) + b'\x00' + struct.pack('>HH', 2, 1)
+
+def _dns_reply(data: bytes) -> Optional[Tuple[int, str]]:
+    if len(data) < 12:
+        return None
+    probe_id, flags = struct.unpack_from('>HH', data)
+    if not flags & 0x8000:
+        return None
+    return probe_id, DNS_RCODES.get(flags & 0xf, f'rcode {flags & 0xf}')
+
+def _ntp_query(probe_id: int) -> bytes:
+    # NTPv4 client request; the server echoes our transmit timestamp as its originate timestamp
+    return b'\x23' + b'\x00' * 39 + probe_id.to_bytes(8, 'big')
+
+def _ntp_reply(data: bytes) -> Optional[Tuple[int, str]]:
+    if len(data) < 48 or data[0] & 0x7 != 4:
+        return None
+    return int.from_bytes(data[24:32], 'big'), f'stratum {data[1]}'
+
+def _ber(tag: int, value: bytes) -> bytes:
+    length = len(value)
+    if length < 0x80:
+        return bytes([tag, length]) + value
+    size = (length.bit_length() + 7) // 8
+    return bytes([tag, 0x80 | size]) + length.to_bytes(size, 'big') + value
+
+def _ber_int(value: int) -> bytes:
+    return _ber(0x02, value.to_bytes(value.bit_length() // 8 + 1, 'big', signed=True))
+
+def _tlv(data: bytes, offset: int = 0) -> Tuple[int, bytes, int]:
+    tag, length = data[offset], data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7f
+        length = int.from_bytes(data[offset:offset + size], 'big')
+        offset += size
+    end = offset + length
+    if end > len(data):
+        raise ValueError('Truncated BER value')
+    return tag, data[offset:end], end
+
+def _ber_children(value: bytes) -> List[Tuple[int, bytes]]:
+    children, offset = [], 0
+    while offset < len(value):
+        tag, child, offset = _tlv(value, offset)
+        children.append((tag, child))
+    return children
+
+SYS_DESCR_OID = bytes.fromhex('2b06010201010100')  # 1.3.6.1.2.1.1.1.0
+
+def _snmp_query(probe_id: int) -> bytes:
+    # SNMPv2c GetRequest for sysDescr.0 with the 'public' community
+    varbind = _ber(0x30, _ber(0x06, SYS_DESCR_OID) + b'\x05\x00')
+    pdu = _ber(0xa0, _ber_int(probe_id) + _ber_int(0) + _ber_int(0) + _ber(0x30, varbind))
+    return _ber(0x30, _ber_int(1) + _ber(0x04, b'public') + pdu)
+
+def _snmp_reply(data: bytes) -> Optional[Tuple[int, str]]:
+    try:
+        tag, message, _ = _tlv(data)
+        fields = _ber_children(message)
+        if tag != 0x30 or len(fields) < 3 or fields[2][0] != 0xa2:
+            return None
+        pdu = _ber_children(fields[2][1])
+        banner = ''
+        for _, varbind in _ber_children(pdu[3][1]):
+            value_tag, value = _ber_children(varbind)[1]
+            if value_tag == 0x04:
+                banner = value.decode('latin-1')[:200]
+        return int.from_bytes(pdu[0][1], 'big', signed=True), banner
+    except (IndexError, ValueError):
+        return None
+
+def _syslog_message(probe_id: int) -> bytes:
+    return f'<14>FlaskNetScan: probe {probe_id}\n'.encode()
+
+def _any_reply(data: bytes) -> Tuple[None, str]:
+    return None, data[:64].decode('latin-1')
+
+UDP_PROBES = {
+    53: UdpProbe('dns', 16, _dns_query, _dns_reply),
+    123: UdpProbe('ntp', 64, _ntp_query, _ntp_reply),
+    161: UdpProbe('snmp', 31, _snmp_query, _snmp_reply),
+    514: UdpProbe('syslog', 32, _syslog_message, None),
+}
+UDP_PORTS = list(UDP_PROBES)
+# Ports without a known protocol get an empty-ish datagram; any reply counts
+GENERIC_PROBE = UdpProbe('unknown', 0, lambda probe_id: b'\r\n', _any_reply)
+
+@dataclass
+class _Host:
+    ip: str
+    states: Dict[int, str] = field(default_factory=dict)
+    banners: Dict[int, str] = field(default_factory=dict)
+
+@dataclass
+class _Probe:
+    host: _Host
+    port: int
+    probe: UdpProbe
+    ids: Set[Optional[int]] = field(default_factory=set)
+    attempt: int = 0
+    deadline: float = 0.0
+
+class UdpProbeEngine:
+    """UDP service scanner: many probes in flight on one socket and selector.
+
+    Every datagram carries a protocol-level ID (DNS transaction ID, NTP
+    transmit timestamp, SNMP request-id); a reply only counts if it comes
+    from the probed address and echoes an ID we sent there. Unanswered
+    probes are retransmitted up to `retries` times with a growing timeout.
+
+    Ports are 'open' when they reply, 'closed' when ICMP port-unreachable
+    comes back (Linux, via IP_RECVERR) and 'open|filtered' when silent.
+    Results come out as HostRecords, like the TCP engines.
+    """
+
+    def __init__(self, concurrency: int = 256, timeout: float = 1.0, retries: int = 2,
+                 rate: float = 0.0, probes: Optional[Dict[int, UdpProbe]] = None,
+                 max_hosts: int = 64):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.rate = rate
+        self.probes = UDP_PROBES if probes is None else probes
+        self.max_hosts = max_hosts
+        self.probes_sent = 0
+        self._ids = itertools.count(int(time.time() * 1000) & 0xffffffff)
+
+    def iter_scan(self, hosts: Iterable[str], ports: List[int] = UDP_PORTS) -> Iterator[HostRecord]:
+        """Yield (ip, open_ports, record) per host, in target order."""
+        ports = list(dict.fromkeys(ports))
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        recverr = IP_RECVERR
+        if recverr is not None:
+            try:
+                sock.setsockopt(socket.SOL_IP, recverr, 1)
+            except OSError:
+                recverr = None
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+
+        targets = iter(hosts)
+        exhausted = False
+        window: deque = deque()
+        queue: deque = deque()
+        pending: Dict[Tuple[str, int], _Probe] = {}
+        deadlines: List = []
+        sequence = itertools.count()
+        next_send = time.monotonic()
+
+        def send(probe: _Probe):
+            probe_id = None
+            if probe.probe.id_bits:
+                probe_id = next(self._ids) & ((1 << probe.probe.id_bits) - 1)
+            probe.ids.add(probe_id)
+            probe.attempt += 1
+            probe.deadline = time.monotonic() + self.timeout * probe.attempt
+            key = (probe.host.ip, probe.port)
+            pending[key] = probe
+            heapq.heappush(deadlines, (probe.deadline, next(sequence), key))
+            payload = probe.probe.build(probe_id)
+            METRICS.probe_started('udp', retransmit=probe.attempt > 1)
+            # A queued ICMP error for an earlier probe surfaces on the next
+            # send, so only a send that fails twice is about this probe
+            for retry in (True, False):
+                try:
+                    sock.sendto(payload, key)
+                    self.probes_sent += 1
+                except BlockingIOError:
+                    pass  # Socket buffer full; the retransmit timer covers it
+                except OSError as e:
+                    if retry:
+                        continue
+                    finish(probe, FILTERED if e.errno in UNREACHABLE_ERRNOS else CLOSED)
+                break
+
+        def finish(probe: _Probe, state: str, banner: Optional[str] = None):
+            del pending[(probe.host.ip, probe.port)]
+            METRICS.probe_finished('udp', state)
+            probe.host.states[probe.port] = state
+            if banner is not None:
+                probe.host.banners[probe.port] = banner
+
+        def receive():
+            while True:
+                try:
+                    data, addr = sock.recvfrom(4096)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    continue  # Pending ICMP error, read from the error queue below
+                probe = pending.get(addr[:2])
+                parsed = probe.probe.parse(data) if probe and probe.probe.parse else None
+                if parsed is not None and parsed[0] in probe.ids:
+                    finish(probe, OPEN, parsed[1])
+            while recverr is not None:
+                try:
+                    _, ancdata, _, addr = sock.recvmsg(4096, 512, socket.MSG_ERRQUEUE)
+                except OSError:
+                    break
+                probe = pending.get(addr[:2]) if addr else None
+                for level, kind, data in ancdata:
+                    if probe is None or level != socket.SOL_IP or kind != recverr:
+                        continue
+                    code = struct.unpack_from('=I', data)[0]
+                    if code == errno.ECONNREFUSED:
+                        finish(probe, CLOSED)
+                    elif code in UNREACHABLE_ERRNOS:
+                        finish(probe, FILTERED)
+                    break
+
+        def expire():
+            now = time.monotonic()
+            while deadlines and deadlines[0][0] <= now:
+                deadline, _, key = heapq.heappop(deadlines)
+                probe = pending.get(key)
+                if probe is None or probe.deadline != deadline:
+                    continue
+                if probe.attempt <= self.retries:
+                    send(probe)
+                else:
+                    finish(probe, OPEN_FILTERED)
+
+        try:
+            while True:
+                while len(pending) < self.concurrency:
+                    if not queue:
+                        if exhausted or len(window) >= self.max_hosts:
+                            break
+                        ip = next(targets, None)
+                        if ip is None:
+                            exhausted = True
+                            break
+                        host = _Host(ip)
+                        window.append(host)
+                        queue.extend((host, port) for port in ports)
+                        continue
+                    if self.rate:
+                        now = time.monotonic()
+                        if now < next_send:
+                            break
+                        next_send = max(now, next_send) + 1.0 / self.rate
+                    host, port = queue.popleft()
+                    send(_Probe(host, port, self.probes.get(port, GENERIC_PROBE)))
+
+                while window and len(window[0].states) == len(ports):
+                    yield self._result(window.popleft())
+                if exhausted and not window:
+                    break
+
+                wake = deadlines[0][0] if deadlines else time.monotonic() + self.timeout
+                if queue and self.rate:
+                    wake = min(wake, next_send)
+                if selector.select(max(0.0, wake - time.monotonic())):
+                    receive()
+                expire()
+        finally:
+            # Probes still waiting when the consumer stops never get an answer
+            for _ in pending:
+                METRICS.probe_finished('udp', CANCELLED)
+            selector.close()
+            sock.close()
+
+    def _result(self, host: _Host) -> HostRecord:
+        # Silence only suggests a listener if the host does send ICMP for closed ports
+        answers = set(host.states.values())
+        services = []
+        for port in sorted(host.states):
+            state = host.states[port]
+            probe = self.probes.get(port, GENERIC_PROBE)
+            quiet = probe.parse is None and state == OPEN_FILTERED and CLOSED in answers
+            if state == OPEN or quiet:
+                services.append({
+                    'port': port,
+                    'protocol': 'udp',
+                    'state': state,
+                    'service': probe.service if probe is not GENERIC_PROBE else None,
+                    'product': None,
+                    'version': None,
+                    'banner': host.banners.get(port, '')
+                })
+        if not services:
+            return host.ip, [], None
+        open_ports = [info['port'] for info in services]
+        return host.ip, open_ports, {
+            'ip': host.ip,
+            'hostname': UNKNOWN_HOSTNAME,
+            'status': 'up',
+            'ports': open_ports,
+            'protocol': 'udp',
+            'services': services
+        }
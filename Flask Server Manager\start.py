@@ -5,15 +5,97 @@ import sys
 import subprocess
 import socket
 import platform
-from flask import Flask, render_template, jsonify, request
+import json
+import time
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
 import threading
 from datetime import datetime
 import psutil
+from scan_engine import AsyncScanEngine, COMMON_PORTS
+from scan_targets import TargetSpec, parse_ports
+from scan_resolver import ReverseResolver, UNKNOWN_HOSTNAME
+from scan_banners import BannerGrabber
+from scan_shards import ShardedScanner
+from scan_distributed import FileQueue, ScanCoordinator
+from scan_results import HostPortTable
+from scan_pacing import PacingPolicy
+from scan_timing import AdaptiveTimeouts
+from scan_state import ScanStateStore, IncrementalScanner
+from scan_history import ScanHistory
+from scan_inventory import AssetInventory
+from scan_priority import DeadlineScanner
+from scan_metrics import METRICS
+from scan_jobs import ScanJobManager, JobQueueFull
+from scan_udp import UdpProbeEngine, UDP_PORTS
+from scan_tls import TlsInspector
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 class ServerManager:
-    def __init__(self):
+    engine_class = AsyncScanEngine
+
+    def __init__(self, scan_engine=None, scan_concurrency=None, scan_discovery=None,
+                 scan_banners=None, scan_tls=None):
         self.os_type = platform.system().lower()
+        # 'async' (default), 'sharded' to spread over SCAN_PROCESSES worker
+        # processes, 'distributed' to hand shards to remote scan workers
+        # through SCAN_QUEUE_DIR, or 'sequential' for one probe at a time
+        self.scan_engine = scan_engine or os.environ.get('SCAN_ENGINE', 'async')
+        self.scan_concurrency = scan_concurrency or int(os.environ.get('SCAN_CONCURRENCY', 512))
+        # Cap on addresses per scan, so one request can't queue a /0 sweep
+        self.max_targets = int(os.environ.get('SCAN_MAX_TARGETS', 65536))
+        # Port-range scans are meant for selected hosts, not whole subnets
+        self.max_port_scan_hosts = int(os.environ.get('SCAN_MAX_PORT_SCAN_HOSTS', 256))
+        # Upper bound for ?budget on deadline-bounded scans, in seconds
+        self.max_deadline_budget = float(os.environ.get('SCAN_MAX_DEADLINE_BUDGET', 300))
+        # Upper bound for addresses x ports on deadline-bounded scans
+        self.max_deadline_probes = int(os.environ.get('SCAN_MAX_DEADLINE_PROBES', 1 << 24))
+        # Upper bound for ?limit on inventory lookups
+        self.max_inventory_results = int(os.environ.get('SCAN_MAX_INVENTORY_RESULTS', 1000))
+        # Liveness pre-filter: only hosts that answer get the full port sweep
+        if scan_discovery is None:
+            scan_discovery = os.environ.get('SCAN_DISCOVERY', '1') != '0'
+        self.scan_discovery = scan_discovery
+        # Optional banner grabbing / fingerprinting of open ports
+        if scan_banners is None:
+            scan_banners = os.environ.get('SCAN_BANNERS', '0') == '1'
+        self.scan_banners = scan_banners
+        self.banners = BannerGrabber()
+        # Optional certificate subject/SANs/issuer/expiry for open TLS ports;
+        # off by default like banners, as it costs a handshake per TLS port
+        if scan_tls is None:
+            scan_tls = os.environ.get('SCAN_TLS', '0') == '1'
+        self.scan_tls = scan_tls
+        self.tls = TlsInspector()
+        # Probe pacing: SCAN_RATE probes/s overall (0 = unlimited) plus
+        # per-/24 and per-host concurrency caps with backoff
+        self.pacing = PacingPolicy(
+            rate=float(os.environ.get('SCAN_RATE', 0)),
+            per_subnet=int(os.environ.get('SCAN_SUBNET_CONCURRENCY', 128)),
+            per_host=int(os.environ.get('SCAN_HOST_CONCURRENCY', 16)),
+            backoff_on_refused=os.environ.get('SCAN_BACKOFF_ON_REFUSED', '0') == '1'
+        )
+        # UDP probes: unanswered datagrams are resent SCAN_UDP_RETRIES times
+        self.udp_timeout = float(os.environ.get('SCAN_UDP_TIMEOUT', 1.0))
+        self.udp_retries = int(os.environ.get('SCAN_UDP_RETRIES', 2))
+        # Shared across scans so repeat sweeps hit the hostname cache
+        self.resolver = ReverseResolver()
+        # Probe timeouts learned from measured RTTs, also kept across scans
+        self.timeouts = AdaptiveTimeouts()
+        # Open host:port pairs with last-seen times, for incremental scans
+        self.state = ScanStateStore(os.environ.get('SCAN_STATE_DB', 'scan_state.db'))
+        # Per host:port open/closed timeline across completed scans
+        self.history = ScanHistory(os.environ.get('SCAN_STATE_DB', 'scan_state.db'))
+        # Hosts and services from every scan, indexed for /api/inventory lookups
+        self.inventory = AssetInventory(os.environ.get('SCAN_STATE_DB', 'scan_state.db'))
+        # Scans started through /api/scan/jobs run here, off the request threads
+        self.jobs = ScanJobManager(
+            max_workers=int(os.environ.get('SCAN_JOB_WORKERS', 2)),
+            max_queued=int(os.environ.get('SCAN_JOB_QUEUE', 8))
+        )
         
     def scan_port(self, ip, port):
         """Scan a single port on an IP address"""
@@ -26,41 +108,110 @@ class ServerManager:
         except:
             return False
 
-    def scan_network(self):
-        """Scan local network for active servers"""
+    def default_targets(self):
+        """Local /24 derived from this host's address"""
+        local_ip = socket.gethostbyname(socket.gethostname())
+        network_prefix = '.'.join(local_ip.split('.')[:-1])
+        return f"{network_prefix}.0/24"
+
+    def parse_targets(self, targets=None, exclude=None):
+        """Build the target spec, defaulting to the local /24"""
+        spec = TargetSpec.parse(targets or self.default_targets(), exclude)
+        if len(spec) > self.max_targets:
+            raise ValueError(f"Scans are limited to {self.max_targets} addresses")
+        return spec
+
+    def make_engine(self):
+        return self.engine_class(concurrency=self.scan_concurrency,
+                                 discovery=self.scan_discovery,
+                                 timeouts=self.timeouts,
+                                 pacing=self.pacing)
+
+    def iter_scan_hosts(self, spec, ports=None):
+        """Yield (ip, open_ports) for every probed host, live or not"""
+        ports = ports or COMMON_PORTS
+        if self.scan_engine == 'sequential':
+            results = self._iter_scan_sequential(spec, ports)
+        elif self.scan_engine == 'sharded':
+            processes = int(os.environ.get('SCAN_PROCESSES', 0)) or None
+            results = ShardedScanner(processes, concurrency=self.scan_concurrency,
+                                     discovery=self.scan_discovery,
+                                     pacing=self.pacing).iter_scan(spec, ports)
+        elif self.scan_engine == 'distributed':
+            coordinator = ScanCoordinator(
+                FileQueue(os.environ.get('SCAN_QUEUE_DIR', 'scan_queue')),
+                shards=int(os.environ.get('SCAN_SHARDS', 8)),
+                heartbeat_timeout=float(os.environ.get('SCAN_WORKER_TIMEOUT', 15)),
+                pacing=self.pacing,
+                discovery=self.scan_discovery
+            )
+            results = coordinator.iter_scan(spec, ports)
+        else:
+            results = self.make_engine().iter_scan(spec, ports)
+
+        # Persist live hosts, and hosts whose known ports may have gone away
+        known = self.state.known_open(spec)
+        live = []
+        for ip, open_ports in results:
+            if open_ports or ip in known:
+                self.state.record_host(ip, ports, open_ports)
+            if open_ports:
+                live.append((ip, open_ports))
+            yield ip, open_ports
+        # Only scans that ran to completion become history epochs
+        self.history.record_epoch(spec, ports, live)
+
+    def incremental_scan(self, targets=None, exclude=None, budget=256):
+        """Re-verify known services, sweep a slice of unknown space, return the diff"""
+        spec = self.parse_targets(targets, exclude)
+        scanner = IncrementalScanner(self.make_engine(), self.state)
+        return scanner.run(spec, COMMON_PORTS, sweep_budget=budget,
+                           spec_key=f"{targets or self.default_targets()}!{exclude or ''}")
+
+    def iter_host_records(self, spec, ports=None, banners=None, tls=None):
+        """Yield (ip, open_ports, record) per probed host; record is None if nothing is open
+
+        Banner grabbing, TLS inspection and DNS run alongside the scan, for live hosts only.
+        """
+        results = (
+            (ip, open_ports, {
+                'ip': ip,
+                'hostname': UNKNOWN_HOSTNAME,
+                'status': 'up',
+                'ports': open_ports
+            } if open_ports else None)
+            for ip, open_ports in self.iter_scan_hosts(spec, ports)
+        )
+        if self.scan_banners if banners is None else banners:
+            results = self.banners.iter_fingerprinted(results)
+        if self.scan_tls if tls is None else tls:
+            results = self.tls.iter_inspected(results)
+        return self.inventory.iter_upserted(self.resolver.iter_resolved(results),
+                                            ports or COMMON_PORTS)
+
+    def iter_udp_records(self, spec, ports=None):
+        """Yield (ip, open_ports, record) per host from a UDP service probe sweep"""
+        engine = UdpProbeEngine(concurrency=self.scan_concurrency, timeout=self.udp_timeout,
+                                retries=self.udp_retries, rate=self.pacing.rate)
+        ports = ports or UDP_PORTS
+        return self.inventory.iter_upserted(
+            self.resolver.iter_resolved(engine.iter_scan(spec, ports)), ports, protocol='udp'
+        )
+
+    def _iter_scan_sequential(self, hosts, ports):
+        """Probe one host and port at a time"""
+        for ip in hosts:
+            yield ip, [port for port in ports if self.scan_port(ip, port)]
+
+    def scan_network(self, targets=None, exclude=None, ports=None):
+        """Scan local network (or the given targets); one record per live host"""
         try:
-            # Get local IP
-            hostname = socket.gethostname()
-            local_ip = socket.gethostbyname(hostname)
-            
-            # Get network prefix
-            ip_parts = local_ip.split('.')
-            network_prefix = '.'.join(ip_parts[:-1])
-            
-            servers = []
-            common_ports = [80, 443, 22, 21, 3389, 3306]  # Web, SSH, FTP, RDP, MySQL
-            
-            # Scan local network
-            for i in range(1, 255):
-                ip = f"{network_prefix}.{i}"
-                try:
-                    # Try to get hostname
-                    try:
-                        hostname = socket.gethostbyaddr(ip)[0]
-                    except:
-                        hostname = "Unknown"
-
-                    # Check common ports
-                    for port in common_ports:
-                        if self.scan_port(ip, port):
-                            servers.append({
-                                'ip': ip,
-                                'hostname': hostname,
-                                'status': 'up'
-                            })
-                except:
-                    pass
-            return servers
+            spec = self.parse_targets(targets, exclude)
+            table = HostPortTable(ports or COMMON_PORTS)
+            for ip, open_ports, record in self.iter_host_records(spec, ports):
+                if record is not None:
+                    table.add_record(record)
+            return list(table.records())
         except Exception as e:
             print(f"Scan error: {e}")
             return []
@@ -85,12 +236,266 @@ class ServerManager:
 
         @app.route('/api/scan')
         def scan():
+            targets = request.args.get('targets')
+            exclude = request.args.get('exclude')
+            try:
+                self.parse_targets(targets, exclude)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             return jsonify({
                 'system': self.get_system_info(),
-                'network': self.scan_network(),
+                'network': self.scan_network(targets, exclude),
                 'timestamp': datetime.now().isoformat()
             })
 
+        @app.route('/api/scan/incremental')
+        def scan_incremental():
+            targets = request.args.get('targets')
+            exclude = request.args.get('exclude')
+            budget = request.args.get('budget', 256, type=int)
+            try:
+                diff = self.incremental_scan(targets, exclude, budget)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            diff['timestamp'] = datetime.now().isoformat()
+            return jsonify(diff)
+
+        @app.route('/api/scan/jobs', methods=['POST'])
+        def create_scan_job():
+            data = request.get_json(silent=True) or {}
+            targets = data.get('targets') or self.default_targets()
+            exclude = data.get('exclude') or ''
+            banners = bool(data.get('banners', self.scan_banners))
+            tls = bool(data.get('tls', self.scan_tls))
+            protocol = data.get('protocol', 'tcp')
+            try:
+                if protocol not in ('tcp', 'udp'):
+                    raise ValueError(f"Unknown protocol: {protocol}")
+                spec = self.parse_targets(targets, exclude)
+                ports = parse_ports(data['ports']) if data.get('ports') else None
+                if protocol == 'udp':
+                    scan = lambda: self.iter_udp_records(spec, ports)
+                else:
+                    scan = lambda: self.iter_host_records(spec, ports, banners=banners, tls=tls)
+                job, created = self.jobs.submit(
+                    (protocol, targets, exclude, data.get('ports'), banners, tls), len(spec),
+                    scan, protocol=protocol
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            except JobQueueFull as e:
+                return jsonify({'error': str(e)}), 429
+            response = job.to_dict()
+            response['attached'] = not created
+            return jsonify(response), 202 if created else 200
+
+        @app.route('/api/scan/jobs')
+        def list_scan_jobs():
+            return jsonify([job.to_dict() for job in self.jobs.list()])
+
+        @app.route('/api/scan/jobs/<job_id>')
+        def get_scan_job(job_id):
+            job = self.jobs.get(job_id)
+            if job is None:
+                return jsonify({'error': 'Job not found'}), 404
+            return jsonify(job.to_dict())
+
+        @app.route('/api/scan/jobs/<job_id>/cancel', methods=['POST'])
+        def cancel_scan_job(job_id):
+            job = self.jobs.cancel(job_id)
+            if job is None:
+                return jsonify({'error': 'Job not found'}), 404
+            return jsonify(job.to_dict())
+
+        @app.route('/api/scan/jobs/<job_id>/result')
+        def get_scan_job_result(job_id):
+            job = self.jobs.get(job_id)
+            if job is None:
+                return jsonify({'error': 'Job not found'}), 404
+            response = job.to_dict()
+            response['network'] = list(job.results.records())
+            return jsonify(response)
+
+        @app.route('/metrics')
+        def metrics():
+            """Prometheus exposition of scanner (and process) metrics"""
+            rendered = METRICS.render()
+            if rendered is None:
+                return jsonify({'error': 'prometheus_client is not installed'}), 503
+            body, content_type = rendered
+            return Response(body, mimetype=content_type)
+
+        @app.route('/api/scan/deadline')
+        def deadline_scan():
+            """Partial scan within ?budget seconds, likeliest targets first, with a coverage report"""
+            try:
+                spec = self.parse_targets(request.args.get('targets'), request.args.get('exclude'))
+                ports = parse_ports(request.args['ports']) if request.args.get('ports') else COMMON_PORTS
+                budget = float(request.args.get('budget', 10))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if not 0 < budget <= self.max_deadline_budget:
+                return jsonify({
+                    'error': f'budget must be between 0 and {self.max_deadline_budget} seconds'
+                }), 400
+            if len(spec) * len(ports) > self.max_deadline_probes:
+                return jsonify({
+                    'error': f'Deadline scans are limited to {self.max_deadline_probes} host/port probes'
+                }), 400
+            result = DeadlineScanner(self.make_engine(), self.state).run(spec, ports, budget)
+            hostnames = self.resolver.resolve_many(record['ip'] for record in result['network'])
+            for record in result['network']:
+                record['hostname'] = hostnames[record['ip']]
+            result['system'] = self.get_system_info()
+            result['timestamp'] = datetime.now().isoformat()
+            return jsonify(result)
+
+        @app.route('/api/scan/history')
+        def scan_history():
+            """Uptime and open/closed change points for ?ip and ?port, optionally ?since (epoch seconds)"""
+            try:
+                ip = request.args['ip']
+                socket.inet_aton(ip)
+                port = int(request.args['port'])
+                since = float(request.args['since']) if request.args.get('since') else None
+            except (KeyError, ValueError, OSError):
+                return jsonify({'error': 'ip and port are required'}), 400
+            response = self.history.uptime(ip, port, since)
+            response['changes'] = self.history.change_points(ip, port, since)
+            return jsonify(response)
+
+        @app.route('/api/inventory')
+        def inventory():
+            """Known hosts filtered by ?port, ?service, ?hostname (trailing * for prefix),
+            ?protocol and ?seen_since (epoch seconds)"""
+            try:
+                port = int(request.args['port']) if request.args.get('port') else None
+                seen_since = float(request.args['seen_since']) if request.args.get('seen_since') else None
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            limit = request.args.get('limit', self.max_inventory_results, type=int)
+            limit = min(max(limit, 1), self.max_inventory_results)
+            return jsonify(self.inventory.hosts(
+                port=port, service=request.args.get('service'),
+                hostname=request.args.get('hostname'), seen_since=seen_since,
+                protocol=request.args.get('protocol'), limit=limit
+            ))
+
+        @app.route('/api/inventory/<ip>')
+        def inventory_host(ip):
+            host = self.inventory.host(ip)
+            if host is None:
+                return jsonify({'error': 'Host not in inventory'}), 404
+            return jsonify(host)
+
+        @app.route('/api/scan/tls/expiring')
+        def expiring_certificates():
+            """Certificates on inventoried services that expire within ?days (default 30)"""
+            try:
+                days = int(request.args.get('days', 30))
+            except ValueError:
+                return jsonify({'error': 'days must be an integer'}), 400
+            return jsonify(self.inventory.expiring(days))
+
+        @app.route('/api/scan/stream')
+        def scan_stream():
+            """Server-Sent Events: one 'host' event per live host plus progress counters"""
+            try:
+                spec = self.parse_targets(request.args.get('targets'), request.args.get('exclude'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            banners = request.args.get('banners', '1' if self.scan_banners else '0') == '1'
+            tls = request.args.get('tls', '1' if self.scan_tls else '0') == '1'
+
+            def events():
+                total = len(spec)
+                probed = found = 0
+                last_progress = 0.0
+                yield sse_event('start', {
+                    'system': self.get_system_info(),
+                    'total': total,
+                    'timestamp': datetime.now().isoformat()
+                })
+                for ip, open_ports, record in self.iter_host_records(spec, banners=banners, tls=tls):
+                    probed += 1
+                    if record is not None:
+                        found += 1
+                        yield sse_event('host', record)
+                    # Throttle progress so a /16 doesn't emit 65k events
+                    now = time.monotonic()
+                    if open_ports or now - last_progress >= 0.25:
+                        last_progress = now
+                        yield sse_event('progress', {
+                            'probed': probed, 'open': found, 'remaining': total - probed
+                        })
+                yield sse_event('done', {'probed': probed, 'open': found, 'remaining': 0})
+
+            return Response(
+                stream_with_context(events()),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        @app.route('/api/scan/ports')
+        def scan_ports_stream():
+            """Server-Sent Events for a full (ports=all) or top-N port sweep of selected hosts"""
+            try:
+                spec = self.parse_targets(request.args.get('targets'), request.args.get('exclude'))
+                ports = parse_ports(request.args.get('ports', 'top:1000'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if len(spec) > self.max_port_scan_hosts:
+                return jsonify({
+                    'error': f'Port-range scans are limited to {self.max_port_scan_hosts} hosts'
+                }), 400
+
+            def events():
+                hosts = list(spec)
+                total = len(hosts) * len(ports)
+                engine = self.make_engine()
+                table = HostPortTable()
+                yield sse_event('start', {
+                    'hosts': len(hosts),
+                    'ports': len(ports),
+                    'total': total,
+                    'timestamp': datetime.now().isoformat()
+                })
+                for found in engine.iter_port_sweep(hosts, ports):
+                    if found is not None:
+                        ip, port = found
+                        table.add(ip, [port])
+                        yield sse_event('port', {'ip': ip, 'port': port})
+                    yield sse_event('progress', {
+                        'probed': engine.probes_done,
+                        'open': len(table),
+                        'remaining': total - engine.probes_done
+                    })
+
+                known = self.state.known_open(spec)
+                for ip in hosts:
+                    if ip in table or ip in known:
+                        self.state.record_host(ip, ports, table.open_ports(ip))
+                self.history.record_epoch(spec, ports, table)
+                hostnames = self.resolver.resolve_many(ip for ip, _ in table)
+                for ip, hostname in hostnames.items():
+                    table.annotate(ip, hostname=hostname)
+                records = {record['ip']: record for record in table.records()}
+                self.inventory.upsert(
+                    ((ip, table.open_ports(ip), records.get(ip)) for ip in hosts), ports
+                )
+                yield sse_event('done', {
+                    'probed': engine.probes_done,
+                    'open': len(table),
+                    'remaining': 0,
+                    'network': list(table.records())
+                })
+
+            return Response(
+                stream_with_context(events()),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
         @app.route('/api/connect', methods=['POST'])
         def connect():
             try:
@@ -190,6 +595,7 @@ class ServerManager:
         <div class="network-scan">
             <h2>Network Scan</h2>
             <button onclick="startScan()" class="btn primary">Start Scan</button>
+            <div id="scanProgress"></div>
             <div id="scanResults" class="server-grid"></div>
         </div>
 
@@ -329,22 +735,37 @@ let selectedServer = null;
 
 function startScan() {
     const button = document.querySelector('.btn.primary');
+    const progress = document.getElementById('scanProgress');
     button.disabled = true;
     button.textContent = 'Scanning...';
+    document.getElementById('scanResults').innerHTML = '';
 
-    fetch('/api/scan')
-        .then(response => response.json())
-        .then(data => {
-            displaySystemInfo(data.system);
-            displayScanResults(data.network);
-            button.disabled = false;
-            button.textContent = 'Start Scan';
-        })
-        .catch(error => {
-            console.error('Scan error:', error);
-            button.disabled = false;
-            button.textContent = 'Start Scan';
-        });
+    const finish = () => {
+        source.close();
+        button.disabled = false;
+        button.textContent = 'Start Scan';
+    };
+
+    const source = new EventSource('/api/scan/stream');
+    source.addEventListener('start', event => {
+        displaySystemInfo(JSON.parse(event.data).system);
+    });
+    source.addEventListener('host', event => {
+        appendScanResult(JSON.parse(event.data));
+    });
+    source.addEventListener('progress', event => {
+        const data = JSON.parse(event.data);
+        progress.textContent = `Probed ${data.probed}, open ${data.open}, remaining ${data.remaining}`;
+    });
+    source.addEventListener('done', event => {
+        const data = JSON.parse(event.data);
+        progress.textContent = `Done: probed ${data.probed}, open ${data.open}`;
+        finish();
+    });
+    source.onerror = error => {
+        console.error('Scan error:', error);
+        finish();
+    };
 }
 
 function displaySystemInfo(info) {
@@ -358,17 +779,27 @@ function displaySystemInfo(info) {
     `;
 }
 
-function displayScanResults(servers) {
-    const container = document.getElementById('scanResults');
-    container.innerHTML = servers.map(server => `
+function renderServerCard(server) {
+    return `
         <div class="server-card" onclick="showConnectionModal('${server.ip}')">
             <h3>${server.hostname}</h3>
             <p><strong>IP:</strong> ${server.ip}</p>
+            <p><strong>Ports:</strong> ${(server.ports || []).join(', ')}</p>
             <p><strong>Status:</strong> 
                 <span class="status ${server.status}">${server.status}</span>
             </p>
         </div>
-    `).join('');
+    `;
+}
+
+function displayScanResults(servers) {
+    const container = document.getElementById('scanResults');
+    container.innerHTML = servers.map(renderServerCard).join('');
+}
+
+function appendScanResult(server) {
+    const container = document.getElementById('scanResults');
+    container.insertAdjacentHTML('beforeend', renderServerCard(server));
 }
 
 function showConnectionModal(ip) {
@@ -0,0 +1,361 @@
+import io
+import threading
+import time
+import pytest
+from app.ssh import commands, transfer
+from app.ssh.commands import iter_command_output, iter_fanout, run_command
+from app.ssh.pool import SSHConnectionPool, PoolExhausted
+from app.ssh.sessions import CancelFlag, RedisSessionRegistry, SessionRegistry, registry_from_env
+from app.ssh.transfer import stream_to_sftp
+
+class FakeChannel:
+    """Channel whose output is queued up front; ``late`` arrives after the exit status."""
+
+    def __init__(self, stdout=(), stderr=(), late=(), exit_code=0):
+        self.pending = {'stdout': list(stdout), 'stderr': list(stderr)}
+        self.late = list(late)
+        self.exit_code = exit_code
+        self.eof_received = False
+        self.closed = False
+        self.command = None
+        self.pty = False
+
+    def get_pty(self):
+        self.pty = True
+
+    def exec_command(self, command):
+        self.command = command
+
+    def recv_ready(self):
+        return bool(self.pending['stdout'])
+
+    def recv(self, size):
+        return self.pending['stdout'].pop(0)
+
+    def recv_stderr_ready(self):
+        return bool(self.pending['stderr'])
+
+    def recv_stderr(self, size):
+        return self.pending['stderr'].pop(0)
+
+    def exit_status_ready(self):
+        return True
+
+    def recv_exit_status(self):
+        return self.exit_code
+
+    def tick(self):
+        if self.late:
+            self.pending['stdout'].extend(self.late)
+            self.late = []
+        elif not any(self.pending.values()):
+            self.eof_received = True
+
+    def close(self):
+        self.closed = True
+
+class FakeSelect:
+    @staticmethod
+    def select(readable, writable, errors, timeout=None):
+        for chan in readable:
+            chan.tick()
+        return readable, [], []
+
+@pytest.fixture(autouse=True)
+def fake_select(monkeypatch):
+    monkeypatch.setattr(commands, 'select', FakeSelect)
+
+class FakeTransport:
+    def __init__(self):
+        self.active = True
+        self.keepalive = None
+        self.channel = None
+        self.open_timeout = None
+
+    def open_session(self, timeout=None):
+        self.open_timeout = timeout
+        if self.channel is None:
+            self.channel = FakeChannel(stdout=[b'ok\n'])
+        return self.channel
+
+    def is_active(self):
+        return self.active
+
+    def send_ignore(self):
+        if not self.active:
+            raise EOFError('transport closed')
+
+    def set_keepalive(self, interval):
+        self.keepalive = interval
+
+class FakeClient:
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.closed = False
+        self.connected = None
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, host, **kwargs):
+        self.connected = (host, kwargs)
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.closed = True
+        self.transport.active = False
+
+@pytest.fixture
+def pool():
+    pool = SSHConnectionPool(max_per_key=1, idle_timeout=0, client_factory=FakeClient)
+    yield pool
+    pool.close()
+
+TARGET = {'host': '10.0.0.5', 'username': 'deploy', 'password': 'secret'}
+
+def test_pool_reuses_clients_and_caps_each_key(pool):
+    conn = pool.acquire(**TARGET)
+    with pytest.raises(PoolExhausted):
+        pool.acquire(wait=0.05, **TARGET)
+    # Other credentials for the same host are a separate key
+    other = pool.acquire(**dict(TARGET, username='backup'))
+    assert other.client is not conn.client
+
+    threading.Timer(0.1, pool.release, [conn]).start()
+    again = pool.acquire(wait=2, **TARGET)
+    assert again.client is conn.client and again.client.transport.keepalive == 30
+    assert pool.stats() == {'keys': 2, 'open': 2, 'idle': 0}
+
+def test_pool_discards_unhealthy_clients(pool):
+    conn = pool.acquire(**TARGET)
+    pool.release(conn)
+    conn.client.transport.active = False
+
+    fresh = pool.acquire(wait=0, **TARGET)
+    assert fresh.client is not conn.client and conn.client.closed
+    assert pool.stats()['open'] == 1
+
+def test_pool_evicts_idle_clients(pool):
+    pool.idle_timeout = 0.05
+    conn = pool.acquire(**TARGET)
+    pool.release(conn)
+    assert pool.evict_idle() == 0
+    time.sleep(0.1)
+
+    assert pool.evict_idle() == 1
+    assert conn.client.closed and pool.stats() == {'keys': 0, 'open': 0, 'idle': 0}
+
+def test_pool_connection_releases_on_error(pool):
+    with pytest.raises(RuntimeError):
+        with pool.connection(**TARGET) as client:
+            raise RuntimeError('command failed')
+    assert client.closed and pool.stats()['open'] == 0
+
+    # A generator closed mid-lease (GeneratorExit) must give its slot back too
+    def lease():
+        with pool.connection(**TARGET) as client:
+            yield client
+
+    leased = lease()
+    client = next(leased)
+    leased.close()
+    assert client.closed
+    with pool.connection(wait=0, **TARGET) as client:
+        assert not client.closed
+    assert pool.stats() == {'keys': 1, 'open': 1, 'idle': 1}
+
+def test_fanout_hosts_share_one_deadline(pool):
+    held = pool.acquire(**TARGET)
+    start = time.monotonic()
+    result, summary = iter_fanout(pool, [dict(TARGET, server_id=1)], 'uptime', timeout=0.2)
+    assert result['status'] == 'timeout' and time.monotonic() - start < 1
+    assert summary['timeout'] == 1
+    pool.release(held)
+
+    # The connect and the command only get what is left of the host's budget
+    target = dict(TARGET, username='backup')
+    result, summary = iter_fanout(pool, [dict(target, server_id=2)], 'uptime', timeout=5)
+    assert result['status'] == 'ok' and result['output'] == 'ok\n'
+    client = pool.acquire(**target).client
+    assert client.connected[1]['timeout'] <= 5 and client.connected[1]['auth_timeout'] <= 5
+    assert client.transport.open_timeout <= 5
+
+def connected_client(channel):
+    client = FakeClient()
+    client.transport.channel = channel
+    return client
+
+def test_run_command_reads_output_sent_after_exit_status():
+    client = connected_client(FakeChannel(stdout=[b'a'], stderr=[b'warn'], late=[b'tail'], exit_code=3))
+    result = run_command(client, 'make', timeout=5)
+    assert result == {'exit_code': 3, 'output': 'atail', 'error': 'warn', 'truncated': False}
+    assert client.transport.channel.closed
+
+def test_command_output_reads_to_eof_and_flushes_decoders():
+    chan = FakeChannel(stdout=[b'line 1\n', b'caf\xc3'], late=[b'\xa9 done\n', b'\xe2\x82'])
+    chunks = list(iter_command_output(connected_client(chan), 'build', max_bytes=1024))
+    assert ''.join(c['data'] for c in chunks[:-1]) == 'line 1\ncaf\u00e9 done\n\ufffd'
+    assert chunks[-1] == {'exit_code': 0, 'bytes': 20, 'truncated': False, 'cancelled': False}
+
+def test_command_output_stops_at_byte_cap():
+    chan = FakeChannel(stdout=[b'x' * 10] * 5)
+    chunks = list(iter_command_output(connected_client(chan), 'yes', max_bytes=25))
+    assert ''.join(c['data'] for c in chunks[:-1]) == 'x' * 25
+    assert chunks[-1] == {'exit_code': None, 'bytes': 25, 'truncated': True, 'cancelled': False}
+    assert chan.closed
+
+def test_command_output_stops_when_cancelled():
+    chan = FakeChannel(stdout=[b'tick\n'] * 100)
+    cancel = threading.Event()
+    output = iter_command_output(connected_client(chan), 'tail -f log', max_bytes=1024, cancel=cancel)
+    assert next(output) == {'stream': 'stdout', 'data': 'tick\n'}
+    cancel.set()
+    assert list(output) == [{'exit_code': None, 'bytes': 5, 'truncated': False, 'cancelled': True}]
+    assert chan.closed and len(chan.pending['stdout']) == 99
+    assert chan.pty
+
+class FakeSFTPClient:
+    """In-memory SFTP server; the last instance is kept for inspection."""
+    last = None
+
+    def __init__(self, fail_after=None, files=None):
+        self.files = dict(files or {})
+        self.removed = []
+        self.closed = False
+        self.fail_after = fail_after
+
+    @classmethod
+    def from_transport(cls, transport, window_size=None, max_packet_size=None):
+        cls.last = cls(**getattr(transport, 'sftp_options', {}))
+        return cls.last
+
+    def open(self, path, mode, bufsize=-1):
+        sftp = self
+        self.files[path] = b''
+
+        class RemoteFile:
+            pipelined = False
+
+            def set_pipelined(self, pipelined=True):
+                self.pipelined = pipelined
+
+            def write(self, data):
+                if sftp.fail_after is not None and len(sftp.files[path]) >= sftp.fail_after:
+                    raise IOError('connection lost')
+                sftp.files[path] += data
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+        return RemoteFile()
+
+    def remove(self, path):
+        self.removed.append(path)
+        self.files.pop(path, None)
+
+    def posix_rename(self, src, dst):
+        self.files[dst] = self.files.pop(src)
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def sftp(monkeypatch):
+    monkeypatch.setattr(transfer, 'SFTPClient', FakeSFTPClient)
+
+def test_stream_to_sftp_writes_in_chunks(sftp):
+    seen = []
+    written = stream_to_sftp(FakeClient(), io.BytesIO(b'x' * 10), '/srv/app.tar', total=10,
+                             chunk_size=4, progress=lambda done, total: seen.append(done))
+    assert written == 10 and FakeSFTPClient.last.files == {'/srv/app.tar': b'x' * 10}
+    assert seen == [4, 8, 10] and FakeSFTPClient.last.closed
+
+@pytest.mark.parametrize('options, error', [
+    ({}, 'Upload incomplete: got 6 of 10 bytes'),
+    ({'fail_after': 4}, 'connection lost'),
+])
+def test_stream_to_sftp_removes_partial_uploads(sftp, options, error):
+    client = FakeClient()
+    client.transport.sftp_options = dict(options, files={'/srv/app.tar': b'old'})
+    with pytest.raises(IOError, match=error):
+        stream_to_sftp(client, io.BytesIO(b'x' * 6), '/srv/app.tar', total=10, chunk_size=4)
+    assert FakeSFTPClient.last.removed == ['/srv/app.tar.part']
+    assert FakeSFTPClient.last.files == {'/srv/app.tar': b'old'}
+    assert FakeSFTPClient.last.closed
+
+class FakeRedis:
+    """Just enough of redis.Redis for RedisSessionRegistry, expiry aside."""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        entry = self.data.setdefault(key, {})
+        for name, item in (mapping or {field: value}).items():
+            entry[name.encode()] = str(item).encode()
+
+    def hgetall(self, key):
+        return self.data.get(key, {})
+
+@pytest.mark.parametrize('make_registry', [
+    lambda: SessionRegistry(),
+    lambda: RedisSessionRegistry(FakeRedis(), 'test-secret'),
+])
+def test_session_registry_tracks_sessions_streams_and_uploads(make_registry):
+    registry = make_registry()
+    session_id = registry.create_session(TARGET)
+    assert registry.session(session_id) == TARGET and registry.session('nope') is None
+
+    registry.add_stream('s1', session_id)
+    cancel = CancelFlag(registry, 's1', interval=0)
+    assert not cancel.is_set() and not registry.cancel_stream('s1', 'someone-else')
+    assert registry.cancel_stream('s1', session_id) and cancel.is_set()
+    registry.drop_stream('s1')
+    assert not registry.cancel_stream('s1', session_id)
+
+    registry.start_upload('u1', session_id, None)
+    registry.update_upload('u1', 4096)
+    assert registry.upload('u1', 'someone-else') is None
+    assert {k: v for k, v in registry.upload('u1', session_id).items() if k != 'started'} == \
+        {'bytes': 4096, 'total': None}
+    registry.drop_upload('u1')
+    assert registry.upload('u1', session_id) is None
+
+    assert registry.drop_session(session_id) and registry.session(session_id) is None
+
+def test_redis_session_registry_encrypts_targets():
+    client = FakeRedis()
+    session_id = RedisSessionRegistry(client, 'test-secret').create_session(TARGET)
+
+    assert b'secret' not in client.data[f'ssh:session:{session_id}']
+    # Any worker configured with the same secret can read the session
+    assert RedisSessionRegistry(client, 'test-secret').session(session_id) == TARGET
+
+def test_redis_session_registry_requires_a_secret(monkeypatch):
+    monkeypatch.setenv('REDIS_HOST', 'redis')
+    monkeypatch.delenv('SSH_SESSION_SECRET', raising=False)
+    monkeypatch.delenv('SECRET_KEY', raising=False)
+    with pytest.raises(RuntimeError, match='SSH_SESSION_SECRET'):
+        registry_from_env(3600)
+    with pytest.raises(ValueError):
+        RedisSessionRegistry(FakeRedis(), '')